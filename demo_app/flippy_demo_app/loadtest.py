@@ -0,0 +1,237 @@
+"""
+An in-process load test of the demo app, for capacity planning. Run it with `manage.py loadtest`.
+
+Each scenario gets a fresh in-memory test database, seeded with users and a rollout table of the given size.
+Threads then request the index page through Django's test client, which checks the demo flags
+and any number of additional flags, and the latency and queries of each request are recorded.
+"""
+
+import random
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, NamedTuple, Optional
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpRequest
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import include, path
+
+from flippy import Flag
+from flippy import snapshot
+from flippy.flag import flag_registry
+from flippy.models import Rollout
+from flippy.subject import subject_registry
+
+from . import views
+
+EXTRA_FLAG_PREFIX = "loadtest_flag_"
+SUBJECTS = ["flippy.subject.IpAddressSubject", "flippy.subject.UserSubject"]
+
+
+def index_with_extra_flags(request: HttpRequest):
+    """The index page, additionally checking all the flags added by the load test."""
+    for flag in flag_registry:
+        if flag.id.startswith(EXTRA_FLAG_PREFIX):
+            flag.get_state_for_request(request)
+    return views.index(request)
+
+
+urlpatterns = [
+    path("loadtest/", index_with_extra_flags),
+    path("", include("flippy_demo_app.urls")),
+]
+
+
+class Scenario(NamedTuple):
+    rollouts: int
+    extra_flags: int
+    caches: bool
+
+
+class Result(NamedTuple):
+    scenario: Scenario
+    # The demo flags and the extra flags, all checked by the page
+    flags: int
+    latencies: List[float]
+    queries: List[int]
+    duration: float
+
+    def percentile(self, percent: int) -> float:
+        # quantiles() needs at least two data points.
+        if len(self.latencies) < 2:
+            return self.latencies[0] if self.latencies else float("nan")
+        return statistics.quantiles(self.latencies, n=100)[percent - 1]
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.duration
+
+    @property
+    def queries_per_request(self) -> float:
+        return statistics.mean(self.queries) if self.queries else float("nan")
+
+
+def get_settings(caches: bool) -> dict:
+    middleware = [
+        "django.contrib.sessions.middleware.SessionMiddleware",
+        "django.contrib.auth.middleware.AuthenticationMiddleware",
+        "django.contrib.messages.middleware.MessageMiddleware",
+    ]
+    if caches:
+        middleware.append("flippy.middleware.FlippyMiddleware")
+    return {
+        "ROOT_URLCONF": __name__,
+        "ALLOWED_HOSTS": ["testserver"],
+        "MIDDLEWARE": middleware,
+        "FLIPPY_SNAPSHOT": caches,
+    }
+
+
+@contextmanager
+def temporary_database() -> Iterator[None]:
+    """Replace the database with an empty in-memory test database within the block."""
+    old_name = connection.creation.create_test_db(verbosity=0, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def run_scenario(
+    scenario: Scenario,
+    threads: int,
+    requests_per_thread: int,
+    users: int,
+    warmup: int = 10,
+) -> Result:
+    """Run a scenario against an empty `temporary_database()`, removing the data afterwards."""
+    flags = [Flag(f"{EXTRA_FLAG_PREFIX}{i}") for i in range(scenario.extra_flags)]
+    try:
+        with override_settings(**get_settings(scenario.caches)):
+            seed(scenario, users)
+            clients = [_create_client(i, users) for i in range(threads)]
+            return _drive(
+                scenario, len(flag_registry), clients, requests_per_thread, warmup
+            )
+    finally:
+        for flag in flags:
+            flag_registry.unregister(flag.id)
+        snapshot.reset()
+        call_command("flush", interactive=False, verbosity=0)
+
+
+def seed(scenario: Scenario, users: int) -> None:
+    # The same rollouts with caches on and off
+    rng = random.Random(f"{scenario.rollouts}-{scenario.extra_flags}")
+    User.objects.bulk_create(User(username=f"user{i}") for i in range(users))
+    flags = list(flag_registry)
+
+    def create_rollout() -> Rollout:
+        flag = rng.choice(flags)
+        subjects = [
+            path
+            for path in SUBJECTS
+            if flag.accepts_subject(subject_registry.get(path))
+        ]
+        return Rollout(
+            flag_id=flag.id,
+            subject=rng.choice(subjects),
+            enable_percentage=rng.choice([0, 10, 50, 100]),
+        )
+
+    Rollout.objects.bulk_create(create_rollout() for _ in range(scenario.rollouts))
+
+
+def _create_client(index: int, users: int) -> Client:
+    client = Client()
+    # Half of the clients are logged in.
+    if index % 2 and users:
+        client.force_login(User.objects.get(username=f"user{index % users}"))
+    return client
+
+
+def _drive(
+    scenario: Scenario,
+    flags: int,
+    clients: List[Client],
+    requests_per_thread: int,
+    warmup: int,
+) -> Result:
+    latencies: List[float] = []
+    queries: List[int] = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(len(clients) + 1)
+    errors: List[BaseException] = []
+
+    def worker(client: Client, seed: int) -> None:
+        rng = random.Random(seed)
+        thread_latencies, thread_queries = [], []
+        query_count = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal query_count
+            query_count += 1
+            return execute(sql, params, many, context)
+
+        try:
+            for _ in range(warmup):
+                client.get("/loadtest/", REMOTE_ADDR=_random_ip(rng))
+            start_barrier.wait()
+            with connection.execute_wrapper(count_query):
+                for _ in range(requests_per_thread):
+                    query_count = 0
+                    started = time.perf_counter()
+                    response = client.get("/loadtest/", REMOTE_ADDR=_random_ip(rng))
+                    thread_latencies.append(time.perf_counter() - started)
+                    thread_queries.append(query_count)
+                    assert response.status_code == 200, response.status_code
+        except BaseException as e:
+            errors.append(e)
+            start_barrier.abort()
+        finally:
+            connection.close()
+        with lock:
+            latencies.extend(thread_latencies)
+            queries.extend(thread_queries)
+
+    workers = [
+        threading.Thread(target=worker, args=(client, i))
+        for i, client in enumerate(clients)
+    ]
+    for thread in workers:
+        thread.start()
+    try:
+        start_barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    duration = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+    return Result(scenario, flags, latencies, queries, duration)
+
+
+def _random_ip(rng: random.Random) -> str:
+    return "10.{}.{}.{}".format(*(rng.randrange(256) for _ in range(3)))
+
+
+def format_results(results: List[Result]) -> Iterator[str]:
+    yield (
+        f"{'rollouts':>9} {'flags':>6} {'caches':>7} {'req/s':>8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries/req':>12}"
+    )
+    for result in results:
+        scenario = result.scenario
+        yield (
+            f"{scenario.rollouts:>9} {result.flags:>6} "
+            f"{'on' if scenario.caches else 'off':>7} {result.throughput:>8.1f} "
+            f"{result.percentile(50) * 1000:>8.2f} {result.percentile(95) * 1000:>8.2f} "
+            f"{result.percentile(99) * 1000:>8.2f} {result.queries_per_request:>12.1f}"
+        )
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from flippy_demo_app.loadtest import (
+    Scenario,
+    format_results,
+    run_scenario,
+    temporary_database,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the index page in-process, reporting latency percentiles and queries per request. "
+        "Uses a temporary in-memory database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rollouts",
+            type=int,
+            nargs="+",
+            default=[100, 10000],
+            help="Sizes of the rollout table to test with.",
+        )
+        parser.add_argument(
+            "--extra-flags",
+            type=int,
+            nargs="+",
+            default=[0, 50],
+            help="Numbers of flags to check in addition to the demo flags.",
+        )
+        parser.add_argument(
+            "--caches",
+            choices=["on", "off", "both"],
+            default="both",
+            help="Whether to use the snapshot and the Flippy middleware.",
+        )
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--requests", type=int, default=250, help="Per thread.")
+        parser.add_argument("--users", type=int, default=100)
+
+    def handle(self, *args, **options):
+        for option in ["threads", "requests"]:
+            if options[option] < 1:
+                raise CommandError(f"--{option} must be at least 1")
+        caches = {"on": [True], "off": [False], "both": [False, True]}[
+            options["caches"]
+        ]
+        scenarios = [
+            Scenario(rollouts, extra_flags, caches_enabled)
+            for rollouts in options["rollouts"]
+            for extra_flags in options["extra_flags"]
+            for caches_enabled in caches
+        ]
+        results = []
+        with temporary_database():
+            for scenario in scenarios:
+                self.stderr.write(f"Running {scenario}...")
+                results.append(
+                    run_scenario(
+                        scenario,
+                        threads=options["threads"],
+                        requests_per_thread=options["requests"],
+                        users=options["users"],
+                    )
+                )
+        for line in format_results(results):
+            self.stdout.write(line)
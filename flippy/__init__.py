@@ -1,4 +1,17 @@
-from .flag import Flag
+from .flag import (
+    Flag,
+    aevaluate_all,
+    aevaluate_all_for_object,
+    evaluate_all,
+    evaluate_all_for_object,
+)
 from .subject import Subject
 
-__all__ = ["Flag", "Subject"]
+__all__ = [
+    "Flag",
+    "Subject",
+    "aevaluate_all",
+    "aevaluate_all_for_object",
+    "evaluate_all",
+    "evaluate_all_for_object",
+]
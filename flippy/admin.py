@@ -1,14 +1,21 @@
+from typing import Dict, List, NamedTuple, Optional
+
 from django.contrib import admin
 from django import forms
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path
 
+from flippy.exceptions import ConfigurationError
+from flippy.export import format_csv, iter_states
 from flippy.flag import flag_registry
-from flippy.models import Rollout
-from flippy.subject import Subject
+from flippy.models import ArchivedRollout, Rollout
+from flippy.subject import Subject, subject_registry
 
 
 class FlagChoices:
     def __iter__(self):
-        for flag in sorted(flag_registry, key=lambda flag: flag.name):
+        for flag in flag_registry.sorted_by_name():
             yield (flag.id, flag.name)
 
 
@@ -27,10 +34,104 @@ class RolloutForm(forms.ModelForm):
         fields = ["flag_id", "subject", "enable_percentage"]
 
 
+class EffectiveFlagState(NamedTuple):
+    flag_id: str
+    flag_name: str
+    default: Optional[bool]
+    # The rollouts that decide the flag's state, starting from the newest.
+    rollouts: List[Rollout]
+
+
+def get_effective_states() -> List[EffectiveFlagState]:
+    """Return the rollouts that currently decide each flag, with a single query."""
+    rollouts_by_flag: Dict[str, List[Rollout]] = {
+        flag.id: [] for flag in flag_registry.sorted_by_name()
+    }
+    shadowed_flag_ids = set()
+    for rollout in Rollout.objects.current().order_by("flag_id", "-create_date"):
+        if rollout.flag_id in shadowed_flag_ids:
+            continue
+        rollouts_by_flag.setdefault(rollout.flag_id, []).append(rollout)
+        try:
+            if subject_registry.get(rollout.subject).always_matches:
+                # Older rollouts of this flag are never reached.
+                shadowed_flag_ids.add(rollout.flag_id)
+        except ConfigurationError:
+            pass
+    states = []
+    for flag_id, rollouts in rollouts_by_flag.items():
+        flag = flag_registry.get(flag_id)
+        states.append(
+            EffectiveFlagState(
+                flag_id=flag_id,
+                flag_name=flag.name if flag else f"<missing flag: `{flag_id}`>",
+                default=flag.default if flag else None,
+                rollouts=rollouts,
+            )
+        )
+    return states
+
+
+@admin.action(description="Export flag states (CSV)")
+def export_flag_states_csv(modeladmin, request, queryset):
+    """
+    An admin action streaming the states of all typed flags for the selected objects.
+
+    Add it to the admin of a model the flags are defined for, e.g. `actions = [export_flag_states_csv]` in a `UserAdmin`.
+    """
+    response = StreamingHttpResponse(
+        format_csv(iter_states(queryset)), content_type="text/csv"
+    )
+    filename = f"flippy-{queryset.model._meta.model_name}-states.csv"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
 class RolloutAdmin(admin.ModelAdmin):
     form = RolloutForm
     list_display = ["flag_name", "subject_name", "enable_percentage", "create_date"]
     list_filter = ["flag_id"]
+    change_list_template = "admin/flippy/rollout/change_list.html"
+
+    def get_urls(self):
+        urls = [
+            path(
+                "effective-state/",
+                self.admin_site.admin_view(self.effective_state_view),
+                name="flippy_rollout_effective_state",
+            )
+        ]
+        return urls + super().get_urls()
+
+    def effective_state_view(self, request):
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Effective flag states",
+            "states": get_effective_states(),
+        }
+        return TemplateResponse(
+            request, "admin/flippy/rollout/effective_state.html", context
+        )
+
+
+class ArchivedRolloutAdmin(admin.ModelAdmin):
+    list_display = [
+        "flag_id",
+        "subject",
+        "enable_percentage",
+        "create_date",
+        "archive_date",
+        "reason",
+    ]
+    list_filter = ["reason", "flag_id"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 admin.site.register(Rollout, RolloutAdmin)
+admin.site.register(ArchivedRollout, ArchivedRolloutAdmin)
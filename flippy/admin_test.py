@@ -0,0 +1,52 @@
+import pytest
+
+from flippy.admin import get_effective_states
+from flippy.flag import Flag
+from flippy.models import Rollout
+
+pytestmark = pytest.mark.django_db
+
+
+def test_current_rollouts_are_newest_per_flag_and_subject():
+    Rollout.objects.create(flag_id="hello", subject="flippy.subject.UserSubject")
+    newest = Rollout.objects.create(
+        flag_id="hello", subject="flippy.subject.UserSubject", enable_percentage=50
+    )
+    other = Rollout.objects.create(
+        flag_id="other", subject="flippy.subject.UserSubject"
+    )
+    assert set(Rollout.objects.current()) == {newest, other}
+
+
+def test_effective_states(django_assert_num_queries):
+    Flag("hello", default=True)
+    Flag("unused")
+    Rollout.objects.create(flag_id="hello", subject="flippy.subject.UserSubject")
+    Rollout.objects.create(flag_id="hello", subject="flippy.subject.IpAddressSubject")
+    Rollout.objects.create(
+        flag_id="hello", subject="flippy.subject.UserSubject", enable_percentage=50
+    )
+    Rollout.objects.create(flag_id="removed", subject="flippy.subject.UserSubject")
+    with django_assert_num_queries(1):
+        states = {state.flag_id: state for state in get_effective_states()}
+    assert [
+        (rollout.subject, rollout.enable_percentage)
+        for rollout in states["hello"].rollouts
+    ] == [("flippy.subject.UserSubject", 50), ("flippy.subject.IpAddressSubject", 100)]
+    assert states["hello"].default is True
+    assert states["unused"].rollouts == []
+    assert states["removed"].flag_name == "<missing flag: `removed`>"
+
+
+def test_changelist_and_effective_state_views(admin_client):
+    Flag("hello")
+    Rollout.objects.create(flag_id="hello", subject="flippy.subject.UserSubject")
+    Rollout.objects.create(flag_id="hello", subject="flippy.subject.NoSuchSubject")
+    response = admin_client.get("/admin/flippy/rollout/")
+    assert response.status_code == 200
+    assert b"missing subject" in response.content
+    response = admin_client.get("/admin/flippy/rollout/effective-state/")
+    assert response.status_code == 200
+    assert b"Hello" in response.content
+    response = admin_client.get("/admin/flippy/archivedrollout/")
+    assert response.status_code == 200
@@ -1,5 +1,20 @@
 from django.apps import AppConfig
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
 
 
 class FlippyConfig(AppConfig):
     name = "flippy"
+
+    def ready(self):
+        from . import metrics, routing, snapshot, store, subject
+        from .models import Rollout
+
+        post_save.connect(snapshot.on_rollout_changed, sender=Rollout)
+        post_delete.connect(snapshot.on_rollout_changed, sender=Rollout)
+        post_save.connect(routing.on_rollout_changed, sender=Rollout)
+        post_delete.connect(routing.on_rollout_changed, sender=Rollout)
+        setting_changed.connect(metrics.on_setting_changed)
+        setting_changed.connect(snapshot.on_setting_changed)
+        setting_changed.connect(store.on_setting_changed)
+        setting_changed.connect(subject.on_setting_changed)
@@ -0,0 +1,142 @@
+"""
+Benchmarks of the flag evaluation hot path, using pytest-benchmark.
+
+They aren't collected with the tests; run them explicitly:
+
+    pip install pytest-benchmark
+    pytest flippy/benchmarks.py --benchmark-group-by=func
+
+The number of queries of a single evaluation is reported in each benchmark's `extra_info`
+(see `--benchmark-json`), next to the timings.
+"""
+
+from itertools import cycle
+from typing import Callable, List, Optional
+
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from . import snapshot
+from .flag import Flag, TypedFlag
+from .models import Rollout
+from .subject import SubjectIdentifier, UserSubject, _get_flag_score
+
+pytest.importorskip("pytest_benchmark")
+
+pytestmark = pytest.mark.django_db
+
+
+class StaffSubject(UserSubject):
+    def get_identifier_for_object(self, user: User) -> Optional[str]:
+        return str(user.pk) if user.is_staff else None
+
+
+class UsernameSubject(UserSubject):
+    def get_identifier_for_object(self, user: User) -> Optional[str]:
+        return user.username
+
+
+class EmailDomainSubject(UserSubject):
+    def get_identifier_for_object(self, user: User) -> Optional[str]:
+        return user.email.rpartition("@")[2] or None
+
+
+SUBJECTS = [
+    "flippy.benchmarks.StaffSubject",
+    "flippy.benchmarks.UsernameSubject",
+    "flippy.benchmarks.EmailDomainSubject",
+    "flippy.subject.UserSubject",
+]
+
+
+@pytest.fixture(params=["database", "snapshot"])
+def store(request, settings):
+    settings.FLIPPY_SNAPSHOT = request.param == "snapshot"
+    yield request.param
+    snapshot.reset()
+
+
+@pytest.fixture
+def user():
+    return User(pk=42, username="bench", email="bench@example.com")
+
+
+def create_rollouts(flag_ids: List[str], rollouts_per_flag: int, subjects: int):
+    subject_paths = cycle(SUBJECTS[:subjects])
+    Rollout.objects.bulk_create(
+        Rollout(
+            flag_id=flag_id,
+            subject=next(subject_paths),
+            enable_percentage=(index * 37) % 101,
+        )
+        for flag_id in flag_ids
+        for index in range(rollouts_per_flag)
+    )
+
+
+def run(benchmark, func: Callable[[], object]) -> None:
+    """Benchmark `func`, recording the number of queries it makes once warmed up."""
+    func()
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    benchmark.extra_info["queries"] = len(queries)
+    benchmark(func)
+
+
+@pytest.mark.parametrize("flags", [1, 10, 100], ids="flags={}".format)
+@pytest.mark.parametrize("rollouts_per_flag", [1, 10], ids="rollouts={}".format)
+@pytest.mark.parametrize("subjects", [1, 4], ids="subjects={}".format)
+def test_get_state_for_request(
+    benchmark, store, user, flags, rollouts_per_flag, subjects
+):
+    all_flags = [Flag(f"flag{i}") for i in range(flags)]
+    create_rollouts([flag.id for flag in all_flags], rollouts_per_flag, subjects)
+    request = RequestFactory().get("/")
+    request.user = user
+
+    def check_all_flags():
+        for flag in all_flags:
+            flag.get_state_for_request(request)
+
+    run(benchmark, check_all_flags)
+
+
+@pytest.mark.parametrize("flags", [1, 10, 100], ids="flags={}".format)
+@pytest.mark.parametrize("rollouts_per_flag", [1, 10], ids="rollouts={}".format)
+@pytest.mark.parametrize("subjects", [1, 4], ids="subjects={}".format)
+def test_get_state_for_object(
+    benchmark, store, user, flags, rollouts_per_flag, subjects
+):
+    all_flags = [TypedFlag[User](f"flag{i}") for i in range(flags)]
+    create_rollouts([flag.id for flag in all_flags], rollouts_per_flag, subjects)
+
+    def check_all_flags():
+        for flag in all_flags:
+            flag.get_state_for_object(user)
+
+    run(benchmark, check_all_flags)
+
+
+@pytest.mark.parametrize("cached", [True, False], ids=["cached", "uncached"])
+def test_get_flag_score(benchmark, cached):
+    identifier = SubjectIdentifier("flippy.subject.UserSubject", "42")
+    flag_ids = [f"flag{i}" for i in range(100)]
+
+    def score_all_flags():
+        if not cached:
+            _get_flag_score.cache_clear()
+        for flag_id in flag_ids:
+            identifier.get_flag_score(flag_id)
+
+    run(benchmark, score_all_flags)
+
+
+@pytest.mark.parametrize("subject", SUBJECTS)
+def test_rollout_get_flag_value(benchmark, user, subject):
+    rollout = Rollout(flag_id="hello", subject=subject, enable_percentage=50)
+    request = RequestFactory().get("/")
+    request.user = user
+    run(benchmark, lambda: rollout.get_flag_value(request))
@@ -0,0 +1,205 @@
+"""
+Materialized flag states, for analytics and bulk jobs that need the exact set of objects a typed flag is enabled for.
+
+`materialize(flag)` (or `manage.py flippy_materialize`) stores the state of a `TypedFlag[Model]` for every object
+of the model in `CohortAssignment`, along with the subject that decided it and the object's score for the flag.
+Later runs are incremental:
+
+- Scores only grow with the enable percentage, so when a rollout's percentage changes from 20% to 30%,
+  only the objects it decides with a score in [0.2, 0.3) are enabled. It's a single update, without rehashing anything.
+- Only objects created since the previous run are evaluated, and assignments of deleted objects are removed.
+  Both are found with queries in the database, without loading all object ids.
+- Rollouts of other flags don't affect the flag's cohort at all.
+
+When rollouts of other subjects are added or removed, the flag's cohort is rebuilt from scratch.
+Changes to the objects themselves (e.g. a subject that matches staff users only, and a user who became staff)
+aren't tracked either. Use `materialize(flag, full=True)` (or `--full`) to rebuild the cohort in that case.
+"""
+
+import json
+from typing import Any, Iterable, List, NamedTuple, Optional
+
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Cast
+
+from .evaluation import DecisionPlan, RolloutValues, UnresolvedRule
+from .flag import TypedFlag
+from .models import Cohort, CohortAssignment
+from .subject import build_identifier
+
+DEFAULT_BATCH_SIZE = 2000
+
+
+class MaterializationResult(NamedTuple):
+    # Objects evaluated from scratch
+    evaluated: int
+    # Existing assignments whose state changed along with the rollouts
+    updated: int
+    # Assignments of objects that no longer exist
+    removed: int
+
+
+def materialize(
+    flag: TypedFlag,
+    objects: Optional["models.QuerySet"] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    full: bool = False,
+) -> MaterializationResult:
+    """
+    Bring the flag's cohort up to date with its rollouts and `objects` (all objects of the flag's type by default).
+
+    New and removed objects are found in the database, and each batch of `batch_size` is committed separately,
+    so neither memory use nor transactions grow with the number of objects. An interrupted run is completed by the next one.
+    """
+    model = _get_model(flag)
+    if objects is None:
+        objects = model._default_manager.all()
+    plan = flag._get_plan()
+    shape: List[RolloutValues] = list(plan.shape)
+    cohort, created = Cohort.objects.get_or_create(
+        flag_id=flag.id,
+        defaults={"plan": json.dumps(shape), "default": flag.default},
+    )
+    previous_shape = [
+        (subject_path, enable_percentage)
+        for subject_path, enable_percentage in json.loads(cohort.plan)
+    ]
+    updated = 0
+    if full or not _have_same_subjects(previous_shape, shape):
+        # The plan is saved only once all assignments are gone,
+        # so an interrupted rebuild is started over by the next run.
+        _delete_in_batches(cohort.assignments.all(), batch_size)
+        with transaction.atomic():
+            Cohort.objects.filter(pk=cohort.pk).update(
+                plan=json.dumps(shape), default=flag.default
+            )
+    else:
+        with transaction.atomic():
+            cohort = Cohort.objects.select_for_update().get(pk=cohort.pk)
+            updated = _apply_changes(cohort, previous_shape, shape, flag.default)
+            cohort.plan = json.dumps(shape)
+            cohort.default = flag.default
+            cohort.save()
+
+    # Correlated anti-joins, so that each batch only probes the unique (cohort, object_id)
+    # index for its own rows, instead of computing the whole set of assigned ids again.
+    assignment = CohortAssignment.objects.filter(
+        cohort=cohort, object_id=Cast(OuterRef("pk"), models.CharField())
+    )
+    new_objects = objects.filter(~Exists(assignment)).order_by("pk")
+    evaluated = 0
+    last_pk = None
+    while True:
+        page = new_objects if last_pk is None else new_objects.filter(pk__gt=last_pk)
+        batch = list(page[:batch_size])
+        if not batch:
+            break
+        with transaction.atomic():
+            # A concurrent run may have assigned some of the objects meanwhile.
+            CohortAssignment.objects.bulk_create(
+                (
+                    CohortAssignment(
+                        cohort=cohort,
+                        object_id=str(obj.pk),
+                        **_assign(plan, flag.default, obj),
+                    )
+                    for obj in batch
+                ),
+                ignore_conflicts=True,
+            )
+        evaluated += len(batch)
+        last_pk = batch[-1].pk
+
+    remaining_object = objects.filter(
+        pk=Cast(OuterRef("object_id"), output_field=model._meta.pk)
+    )
+    removed_assignments = cohort.assignments.filter(~Exists(remaining_object))
+    removed = _delete_in_batches(removed_assignments, batch_size)
+    return MaterializationResult(evaluated, updated, removed)
+
+
+def _delete_in_batches(assignments: "models.QuerySet", batch_size: int) -> int:
+    # Continue after the last batch, rather than scanning the assignments kept so far again.
+    deleted = 0
+    last_id = 0
+    while True:
+        ids = list(
+            assignments.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += CohortAssignment.objects.filter(id__in=ids).delete()[0]
+        last_id = ids[-1]
+
+
+def get_enabled_objects(
+    flag: TypedFlag, objects: Optional["models.QuerySet"] = None
+) -> "models.QuerySet":
+    """Return the objects the flag was enabled for when it was last materialized."""
+    model = _get_model(flag)
+    if objects is None:
+        objects = model._default_manager.all()
+    enabled_ids = (
+        CohortAssignment.objects.filter(cohort__flag_id=flag.id, enabled=True)
+        .annotate(pk_value=Cast("object_id", output_field=model._meta.pk))
+        .values("pk_value")
+    )
+    return objects.filter(pk__in=enabled_ids)
+
+
+def _get_model(flag: TypedFlag) -> "type[models.Model]":
+    model = flag.expected_type
+    if not (isinstance(model, type) and issubclass(model, models.Model)):
+        raise TypeError(
+            f"Only flags of model instances can be materialized, not `{flag.id}`"
+        )
+    return model
+
+
+def _have_same_subjects(
+    previous_shape: Iterable[RolloutValues], shape: Iterable[RolloutValues]
+) -> bool:
+    return [subject for subject, _ in previous_shape] == [
+        subject for subject, _ in shape
+    ]
+
+
+def _apply_changes(
+    cohort: Cohort,
+    previous_shape: Iterable[RolloutValues],
+    shape: Iterable[RolloutValues],
+    default: bool,
+) -> int:
+    """Update the assignments after rollouts of the same subjects changed their percentages."""
+    updated = 0
+    for (subject_path, previous), (_, current) in zip(previous_shape, shape):
+        if current == previous:
+            continue
+        low, high = sorted((previous / 100, current / 100))
+        updated += cohort.assignments.filter(
+            decided_by=subject_path, score__gte=low, score__lt=high
+        ).update(enabled=current > previous)
+    if default != cohort.default:
+        updated += cohort.assignments.filter(decided_by="").update(enabled=default)
+    return updated
+
+
+def _assign(plan: DecisionPlan, default: bool, obj: Any) -> dict:
+    for rule in plan.rules:
+        if isinstance(rule, UnresolvedRule):
+            raise rule.error
+        identifier = build_identifier(rule.subject, obj)
+        if identifier is None:
+            continue
+        # Unlike `Rule.get_value`, compute the score even at 0% and 100%,
+        # so that the assignment can be updated when the percentage changes.
+        score = identifier.get_flag_score(plan.flag_id)
+        return {
+            "decided_by": rule.subject_path,
+            "score": score,
+            "enabled": score < rule.enable_fraction,
+        }
+    return {"decided_by": "", "score": None, "enabled": default}
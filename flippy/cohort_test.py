@@ -0,0 +1,137 @@
+from io import StringIO
+from typing import Optional
+
+import pytest
+from django.contrib.auth.models import AbstractUser, User
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from .cohort import get_enabled_objects, materialize
+from .flag import TypedFlag
+from .models import Cohort, Rollout
+from .subject import UserSubject
+
+pytestmark = pytest.mark.django_db
+
+
+class StaffSubject(UserSubject):
+    def get_identifier_for_object(self, user: AbstractUser) -> Optional[str]:
+        return str(user.pk) if user.is_staff else None
+
+
+@pytest.fixture
+def users():
+    User.objects.bulk_create(
+        [User(username=f"user{i}", is_staff=i % 4 == 0) for i in range(200)]
+    )
+    return User.objects.all()
+
+
+def rollout(flag, subject, enable_percentage):
+    Rollout.objects.create(
+        flag_id=flag.id, subject=subject, enable_percentage=enable_percentage
+    )
+
+
+def assert_matches_flag(flag, users):
+    expected = {user.pk for user in users if flag.get_state_for_object(user)}
+    assert set(get_enabled_objects(flag).values_list("pk", flat=True)) == expected
+
+
+def test_materialize_matches_flag_states(users):
+    f = TypedFlag[User]("hello")
+    rollout(f, "flippy.subject.UserSubject", 30)
+    rollout(f, "flippy.cohort_test.StaffSubject", 100)
+    result = materialize(f, batch_size=50)
+    assert result == (200, 0, 0)
+    assert_matches_flag(f, users)
+
+
+def test_percentage_changes_dont_reevaluate_objects(users):
+    f = TypedFlag[User]("hello")
+    rollout(f, "flippy.subject.UserSubject", 20)
+    materialize(f)
+    rollout(f, "flippy.subject.UserSubject", 60)
+    result = materialize(f)
+    assert result.evaluated == 0
+    assert result.updated > 0
+    assert_matches_flag(f, users)
+    rollout(f, "flippy.subject.UserSubject", 10)
+    assert materialize(f).evaluated == 0
+    assert_matches_flag(f, users)
+
+
+def test_default_changes_dont_reevaluate_objects(users):
+    f = TypedFlag[User]("hello")
+    rollout(f, "flippy.cohort_test.StaffSubject", 0)
+    materialize(f)
+    # As if the default of the flag had been changed in code
+    Cohort.objects.update(default=True)
+    result = materialize(f)
+    assert result.evaluated == 0
+    assert result.updated == 150
+    assert_matches_flag(f, users)
+
+
+def test_new_subject_rebuilds_cohort(users):
+    f = TypedFlag[User]("hello")
+    rollout(f, "flippy.subject.UserSubject", 20)
+    materialize(f)
+    rollout(f, "flippy.cohort_test.StaffSubject", 100)
+    assert materialize(f).evaluated == 200
+    assert_matches_flag(f, users)
+
+
+def test_only_new_and_deleted_objects_are_synced(users):
+    f = TypedFlag[User]("hello")
+    rollout(f, "flippy.subject.UserSubject", 50)
+    materialize(f)
+    User.objects.filter(pk__in=list(users.values_list("pk", flat=True)[:10])).delete()
+    User.objects.create(username="new")
+    assert materialize(f) == (1, 0, 10)
+    assert_matches_flag(f, User.objects.all())
+
+
+def test_new_and_deleted_objects_are_synced_in_batches(users):
+    f = TypedFlag[User]("hello")
+    rollout(f, "flippy.subject.UserSubject", 50)
+    pks = sorted(users.values_list("pk", flat=True))
+    materialize(f, objects=User.objects.filter(pk__lte=pks[100]), batch_size=7)
+    assert materialize(f, batch_size=7) == (99, 0, 0)
+    assert materialize(f, objects=User.objects.filter(is_staff=True), batch_size=7) == (
+        0,
+        0,
+        150,
+    )
+    assert_matches_flag(f, User.objects.filter(is_staff=True))
+
+
+def test_new_and_deleted_objects_are_found_with_anti_joins(users):
+    f = TypedFlag[User]("hello")
+    rollout(f, "flippy.subject.UserSubject", 50)
+    materialize(f)
+    users.filter(is_staff=True).delete()
+    with CaptureQueriesContext(connection) as queries:
+        assert materialize(f, batch_size=7) == (0, 0, 50)
+    selects = [q["sql"] for q in queries if q["sql"].startswith("SELECT")]
+    assert not any(" IN (SELECT" in sql for sql in selects)
+    # One page of new objects, then 8 batches of removed assignments and an empty one,
+    # each continuing after the previous one.
+    assert sum("NOT EXISTS" in sql for sql in selects) == 1 + 9
+    assert sum('"flippy_cohortassignment"."id" >' in sql for sql in selects) == 9
+
+
+def test_only_model_flags_can_be_materialized():
+    with pytest.raises(TypeError):
+        materialize(TypedFlag[int]("hello"))
+
+
+def test_materialize_command(users):
+    f = TypedFlag[User]("hello")
+    TypedFlag[int]("numbers")
+    rollout(f, "flippy.subject.UserSubject", 50)
+    out = StringIO()
+    call_command("flippy_materialize", stdout=out)
+    assert out.getvalue() == "hello: evaluated 200 objects, updated 0, removed 0\n"
+    assert_matches_flag(f, users)
@@ -0,0 +1,126 @@
+"""
+Moving rollouts that can no longer affect any flag out of the `Rollout` table.
+
+Used by `manage.py flippy_compact`. A rollout is archived when:
+
+- a newer rollout of the same flag and subject exists (it always decides first),
+- a newer rollout of the same flag has a subject that matches every object, or
+- its flag is no longer defined in code (only if asked to, see `compact()`).
+
+Archived rollouts are kept in `ArchivedRollout`, for the audit trail.
+"""
+
+from typing import Collection, Dict, List, NamedTuple
+
+from django.db import connections, models, router, transaction
+
+from .exceptions import ConfigurationError
+from .flag import flag_registry
+from .models import ArchivedRollout, Rollout, RolloutChange
+from .subject import subject_registry
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class CompactionResult(NamedTuple):
+    # The number of archived rollouts, by `ArchivedRollout.reason`
+    archived: Dict[str, int]
+    remaining: int
+
+    @property
+    def total_archived(self) -> int:
+        return sum(self.archived.values())
+
+
+def get_archivable_rollouts(
+    reason: str, known_flag_ids: Collection[str]
+) -> "models.QuerySet[Rollout]":
+    if reason == ArchivedRollout.MISSING_FLAG:
+        return Rollout.objects.exclude(flag_id__in=known_flag_ids)
+    assert reason == ArchivedRollout.SUPERSEDED
+    shadowed_by_newer_rollout = ~models.Q(id__in=Rollout.objects.current().values("id"))
+    # Subjects that match every object shadow all older rollouts of the flag, whatever their subject.
+    shadowed_by_catch_all = models.Exists(
+        Rollout.objects.filter(
+            flag_id=models.OuterRef("flag_id"),
+            subject__in=_get_catch_all_subject_paths(),
+            create_date__gt=models.OuterRef("create_date"),
+        )
+    )
+    return Rollout.objects.filter(flag_id__in=known_flag_ids).filter(
+        shadowed_by_newer_rollout | shadowed_by_catch_all
+    )
+
+
+def _get_catch_all_subject_paths() -> List[str]:
+    paths = []
+    for path in Rollout.objects.values_list("subject", flat=True).distinct():
+        try:
+            if subject_registry.get(path).always_matches:
+                paths.append(path)
+        except ConfigurationError:
+            pass
+    return paths
+
+
+def compact(
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    include_missing_flags: bool = False,
+    dry_run: bool = False,
+) -> CompactionResult:
+    """
+    Archive the rollouts that can't affect any flag, `batch_size` rollouts per transaction.
+
+    With `dry_run`, only count them.
+
+    Flags only count as defined once the modules defining them are imported, so `include_missing_flags`
+    is off by default: a flag that isn't registered yet would otherwise lose its live rollouts.
+    """
+    known_flag_ids = [flag.id for flag in flag_registry]
+    reasons = [ArchivedRollout.SUPERSEDED]
+    if include_missing_flags:
+        reasons.append(ArchivedRollout.MISSING_FLAG)
+    archived = {}
+    for reason in reasons:
+        rollouts = get_archivable_rollouts(reason, known_flag_ids)
+        if dry_run:
+            archived[reason] = rollouts.count()
+            continue
+        ids = list(rollouts.values_list("id", flat=True))
+        archived[reason] = sum(
+            _archive_batch(ids[start : start + batch_size], reason, known_flag_ids)
+            for start in range(0, len(ids), batch_size)
+        )
+    remaining = Rollout.objects.count() - (sum(archived.values()) if dry_run else 0)
+    return CompactionResult(archived, remaining)
+
+
+def _archive_batch(ids: List[int], reason: str, known_flag_ids: Collection[str]) -> int:
+    using = router.db_for_write(Rollout)
+    with transaction.atomic(using=using):
+        # Check the rollouts again: a newer rollout could have been deleted meanwhile.
+        rollouts = list(
+            get_archivable_rollouts(reason, known_flag_ids)
+            .using(using)
+            .filter(id__in=ids)
+            .select_for_update()
+        )
+        ArchivedRollout.objects.using(using).bulk_create(
+            [ArchivedRollout.from_rollout(rollout, reason) for rollout in rollouts]
+        )
+        _delete_rollouts([rollout.id for rollout in rollouts], using)
+        RolloutChange.record({rollout.flag_id for rollout in rollouts}, using=using)
+    return len(rollouts)
+
+
+def _delete_rollouts(ids: List[int], using: str) -> None:
+    # QuerySet.delete() would send the delete signals for each row, each of which logs
+    # a change and publishes the snapshot on commit. The caller logs each affected flag
+    # once instead. Nothing references rollouts, so there is nothing to cascade.
+    if not ids:
+        return
+    connection = connections[using]
+    table = connection.ops.quote_name(Rollout._meta.db_table)
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", ids)
@@ -0,0 +1,102 @@
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from .compaction import compact
+from .flag import Flag
+from .models import ArchivedRollout, Rollout, RolloutChange
+
+pytestmark = pytest.mark.django_db
+
+
+def create_rollout(flag_id, subject, enable_percentage=100, age=0):
+    rollout = Rollout.objects.create(
+        flag_id=flag_id, subject=subject, enable_percentage=enable_percentage
+    )
+    # Make sure the order doesn't depend on the clock resolution.
+    Rollout.objects.filter(pk=rollout.pk).update(
+        create_date=timezone.now() - timedelta(days=age)
+    )
+    return Rollout.objects.get(pk=rollout.pk)
+
+
+def test_compact_archives_superseded_rollouts():
+    Flag("hello")
+    old = create_rollout("hello", "flippy.subject.UserSubject", 0, age=3)
+    create_rollout("hello", "flippy.subject.IpAddressSubject", age=2)
+    create_rollout("hello", "flippy.subject.UserSubject", 50, age=1)
+    result = compact(batch_size=1, include_missing_flags=True)
+    assert result.archived == {"superseded": 1, "missing_flag": 0}
+    assert result.remaining == 2
+    archived = ArchivedRollout.objects.get()
+    assert archived.rollout_id == old.id
+    assert archived.enable_percentage == 0
+    assert archived.create_date == old.create_date
+    assert not Rollout.objects.filter(pk=old.pk).exists()
+
+
+def test_compact_archives_rollouts_shadowed_by_subject_matching_everything():
+    Flag("hello")
+    create_rollout("hello", "flippy.subject.IpAddressSubject", age=2)
+    create_rollout("hello", "flippy.evaluation_test.EveryoneSubject", age=1)
+    create_rollout("hello", "flippy.subject.UserSubject", age=0)
+    result = compact()
+    assert result.archived["superseded"] == 1
+    assert ArchivedRollout.objects.get().subject == "flippy.subject.IpAddressSubject"
+
+
+def test_compact_archives_rollouts_of_missing_flags():
+    Flag("hello")
+    create_rollout("hello", "flippy.subject.UserSubject")
+    create_rollout("removed", "flippy.subject.UserSubject")
+    assert compact().total_archived == 0
+    result = compact(include_missing_flags=True)
+    assert result.archived["missing_flag"] == 1
+    assert ArchivedRollout.objects.get().reason == ArchivedRollout.MISSING_FLAG
+
+
+def test_compact_logs_changes_once_per_flag():
+    Flag("hello")
+    for age in range(3):
+        create_rollout("hello", "flippy.subject.UserSubject", age=age)
+    version = RolloutChange.get_current_version()
+    compact()
+    assert RolloutChange.get_changed_flag_ids(
+        version, RolloutChange.get_current_version()
+    ) == {"hello"}
+    assert RolloutChange.objects.filter(version__gt=version).count() == 1
+
+
+def test_compact_dry_run():
+    Flag("hello")
+    create_rollout("hello", "flippy.subject.UserSubject", age=1)
+    create_rollout("hello", "flippy.subject.UserSubject", age=0)
+    result = compact(dry_run=True)
+    assert result.total_archived == 1
+    assert result.remaining == 1
+    assert Rollout.objects.count() == 2
+    assert not ArchivedRollout.objects.exists()
+
+
+def test_compact_command():
+    Flag("hello")
+    create_rollout("hello", "flippy.subject.UserSubject", age=1)
+    create_rollout("hello", "flippy.subject.UserSubject", age=0)
+    out = StringIO()
+    call_command("flippy_compact", "--dry-run", stdout=out)
+    assert "Would archive 1 rollouts in total, 1 remaining." in out.getvalue()
+    call_command("flippy_compact", stdout=out)
+    assert "Archived 1 rollouts in total, 1 remaining." in out.getvalue()
+
+
+def test_compact_command_keeps_missing_flags_by_default():
+    Flag("hello")
+    create_rollout("removed", "flippy.subject.UserSubject")
+    out = StringIO()
+    call_command("flippy_compact", stdout=out)
+    assert Rollout.objects.count() == 1
+    call_command("flippy_compact", "--archive-missing-flags", stdout=out)
+    assert ArchivedRollout.objects.get().reason == ArchivedRollout.MISSING_FLAG
@@ -0,0 +1,14 @@
+import pytest
+
+from flippy.flag import flag_registry
+
+
+@pytest.fixture(autouse=True)
+def isolated_flag_registry():
+    """Let each test define its own flags without clashing with other tests."""
+    flags = list(flag_registry)
+    flag_registry.clear()
+    yield
+    flag_registry.clear()
+    for flag in flags:
+        flag_registry.register(flag)
@@ -0,0 +1,171 @@
+"""
+Per-request memoization of flag states and subject identifiers.
+
+An `EvaluationCache` is created for each request by `flippy.middleware.FlippyMiddleware`.
+While it's active, each flag is evaluated at most once per request (or object),
+and each subject computes its identifier at most once.
+
+Outside of requests (e.g. in management commands or Celery tasks),
+the same behaviour can be enabled with `with evaluation_cache(): ...`.
+Caches only remember the most recently used `max_objects` objects. To check a flag
+for a large number of objects, use `TypedFlag.get_states_for_objects()` instead.
+"""
+
+import asyncio
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+from django.http import HttpRequest
+
+from .subject import Subject, SubjectIdentifier, abuild_identifier, build_identifier
+
+if TYPE_CHECKING:
+    from flippy.flag import Flag
+
+REQUEST_ATTRIBUTE = "_flippy_cache"
+# How many requests or objects a cache remembers the flag states of.
+DEFAULT_MAX_OBJECTS = 1000
+
+
+class _ObjectEntry:
+    """The flag states and subject identifiers memoized for one request or object."""
+
+    __slots__ = ("obj", "flag_states", "identifiers")
+
+    def __init__(self, obj: Any) -> None:
+        # Entries are keyed by the object's id(), so hold a reference to the object
+        # to make sure the id doesn't get reused by another object meanwhile.
+        self.obj = obj
+        self.flag_states: Dict[str, bool] = {}
+        self.identifiers: Dict[str, Optional[SubjectIdentifier]] = {}
+
+
+class EvaluationCache:
+    """
+    Memoizes flag states and subject identifiers, for at most `max_objects` objects.
+
+    Once full, the entries of the least recently used object are dropped,
+    so looping over many objects within one cache doesn't keep all of them in memory.
+    """
+
+    def __init__(self, max_objects: int = DEFAULT_MAX_OBJECTS) -> None:
+        self.max_objects = max_objects
+        self._entries: "OrderedDict[int, _ObjectEntry]" = OrderedDict()
+        self._pending_identifiers: Dict[Tuple[str, int], "asyncio.Future"] = {}
+
+    def get_flag_state(
+        self, flag: "Flag", obj: Any, evaluate: Callable[[], bool]
+    ) -> bool:
+        flag_states = self._get_entry(obj).flag_states
+        try:
+            return flag_states[flag.id]
+        except KeyError:
+            state = flag_states[flag.id] = evaluate()
+            return state
+
+    async def aget_flag_state(
+        self, flag: "Flag", obj: Any, evaluate: Callable[[], Awaitable[bool]]
+    ) -> bool:
+        flag_states = self._get_entry(obj).flag_states
+        try:
+            return flag_states[flag.id]
+        except KeyError:
+            state = flag_states[flag.id] = await evaluate()
+            return state
+
+    def has_flag_state(self, flag: "Flag", obj: Any) -> bool:
+        entry = self._entries.get(id(obj))
+        return entry is not None and flag.id in entry.flag_states
+
+    def set_flag_state(self, flag_id: str, obj: Any, state: bool) -> None:
+        """Provide the state of a flag for an object, known from elsewhere."""
+        self._get_entry(obj).flag_states[flag_id] = state
+
+    def get_flag_states(self, obj: Any) -> Dict[str, bool]:
+        """Return the states of the flags evaluated for an object so far."""
+        entry = self._entries.get(id(obj))
+        return dict(entry.flag_states) if entry is not None else {}
+
+    def get_identifier(self, subject: Subject, obj: Any) -> Optional[SubjectIdentifier]:
+        identifiers = self._get_entry(obj).identifiers
+        try:
+            return identifiers[subject.subject_class]
+        except KeyError:
+            identifier = identifiers[subject.subject_class] = build_identifier(
+                subject, obj
+            )
+            return identifier
+
+    async def aget_identifier(
+        self, subject: Subject, obj: Any
+    ) -> Optional[SubjectIdentifier]:
+        try:
+            return self._get_entry(obj).identifiers[subject.subject_class]
+        except KeyError:
+            pass
+        # Flags can be evaluated concurrently; make sure that each identifier
+        # is still only computed once.
+        key = (subject.subject_class, id(obj))
+        try:
+            pending = self._pending_identifiers[key]
+        except KeyError:
+            pending = self._pending_identifiers[key] = asyncio.ensure_future(
+                abuild_identifier(subject, obj)
+            )
+        try:
+            identifier = await pending
+        finally:
+            self._pending_identifiers.pop(key, None)
+        self._get_entry(obj).identifiers[subject.subject_class] = identifier
+        return identifier
+
+    def _get_entry(self, obj: Any) -> _ObjectEntry:
+        obj_id = id(obj)
+        entry = self._entries.get(obj_id)
+        if entry is None:
+            entry = self._entries[obj_id] = _ObjectEntry(obj)
+            if len(self._entries) > self.max_objects:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(obj_id)
+        return entry
+
+
+_current_cache: ContextVar[Optional[EvaluationCache]] = ContextVar(
+    "flippy_evaluation_cache", default=None
+)
+
+
+def get_cache_for(obj: Any) -> Optional[EvaluationCache]:
+    """Return the cache to be used when evaluating flags for a request or an object."""
+    if isinstance(obj, HttpRequest):
+        cache = getattr(obj, REQUEST_ATTRIBUTE, None)
+        if cache is not None:
+            return cache
+    return _current_cache.get()
+
+
+@contextmanager
+def evaluation_cache(
+    request: Optional[HttpRequest] = None, max_objects: int = DEFAULT_MAX_OBJECTS
+) -> Iterator[EvaluationCache]:
+    """Memoize flag evaluations within the block, optionally binding the cache to a request."""
+    cache = EvaluationCache(max_objects=max_objects)
+    if request is not None:
+        setattr(request, REQUEST_ATTRIBUTE, cache)
+    token = _current_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _current_cache.reset(token)
@@ -0,0 +1,113 @@
+from typing import Optional
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.http import HttpRequest
+
+from .context import evaluation_cache, get_cache_for
+from .flag import Flag, TypedFlag, aevaluate_all
+from .models import Rollout
+from .subject import TypedSubject
+from .test_utils import request_factory, user_factory
+
+pytestmark = pytest.mark.django_db
+
+
+class CountingSubject(TypedSubject[User]):
+    calls = 0
+
+    def get_identifier_for_request(self, request: HttpRequest) -> Optional[str]:
+        return self.get_identifier_for_object(request.user)
+
+    def get_identifier_for_object(self, user: User) -> Optional[str]:
+        CountingSubject.calls += 1
+        return str(user.pk)
+
+    def is_supported_type(self, type: type) -> bool:
+        return issubclass(type, User)
+
+
+@pytest.fixture(autouse=True)
+def reset_calls():
+    CountingSubject.calls = 0
+
+
+def test_flag_state_is_evaluated_once_per_request(django_assert_num_queries):
+    f = Flag("hello")
+    Rollout.objects.create(flag_id=f.id, subject="flippy.context_test.CountingSubject")
+    request = request_factory(user=user_factory(pk=1))
+    with evaluation_cache(request):
+        with django_assert_num_queries(1):
+            assert f.get_state_for_request(request) is True
+            assert f.get_state_for_request(request) is True
+    assert CountingSubject.calls == 1
+
+
+def test_subject_identifier_is_shared_between_flags():
+    flags = [Flag("hello"), Flag("hello2"), Flag("hello3")]
+    for f in flags:
+        Rollout.objects.create(
+            flag_id=f.id, subject="flippy.context_test.CountingSubject"
+        )
+    request = request_factory(user=user_factory(pk=1))
+    with evaluation_cache(request):
+        for f in flags:
+            f.get_state_for_request(request)
+    assert CountingSubject.calls == 1
+
+
+def test_typed_flag_uses_active_cache():
+    f = TypedFlag[User]("hello")
+    Rollout.objects.create(flag_id=f.id, subject="flippy.context_test.CountingSubject")
+    user, other_user = User(pk=1), User(pk=2)
+    with evaluation_cache():
+        f.get_state_for_object(user)
+        f.get_state_for_object(user)
+        f.get_state_for_object(other_user)
+    assert CountingSubject.calls == 2
+
+
+def test_without_cache_flags_are_evaluated_each_time():
+    f = Flag("hello")
+    Rollout.objects.create(flag_id=f.id, subject="flippy.context_test.CountingSubject")
+    request = request_factory(user=user_factory(pk=1))
+    f.get_state_for_request(request)
+    f.get_state_for_request(request)
+    assert CountingSubject.calls == 2
+
+
+def test_cache_is_bound_to_request():
+    request = request_factory()
+    with evaluation_cache(request) as cache:
+        assert get_cache_for(request) is cache
+        assert get_cache_for(User()) is cache
+    assert get_cache_for(User()) is None
+
+
+def test_concurrent_async_flags_share_subject_identifier():
+    flags = [Flag("hello"), Flag("hello2"), Flag("hello3")]
+    for f in flags:
+        Rollout.objects.create(
+            flag_id=f.id, subject="flippy.context_test.CountingSubject"
+        )
+    request = request_factory(user=user_factory(pk=1))
+    with evaluation_cache(request):
+        states = async_to_sync(aevaluate_all)(request)
+    assert states == {"hello": True, "hello2": True, "hello3": True}
+    assert CountingSubject.calls == 1
+
+
+def test_cache_drops_least_recently_used_objects():
+    f = TypedFlag[User]("hello")
+    Rollout.objects.create(flag_id=f.id, subject="flippy.context_test.CountingSubject")
+    users = [User(pk=pk) for pk in range(3)]
+    with evaluation_cache(max_objects=2) as cache:
+        for user in users:
+            f.get_state_for_object(user)
+        assert not cache.has_flag_state(f, users[0])
+        assert cache.has_flag_state(f, users[2])
+        f.get_state_for_object(users[2])
+        f.get_state_for_object(users[0])
+    assert CountingSubject.calls == 4
+    assert len(cache._entries) == 2
@@ -0,0 +1,223 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union, TYPE_CHECKING
+
+from .exceptions import ConfigurationError
+from .subject import (
+    Subject,
+    SubjectIdentifier,
+    abuild_identifier,
+    build_identifier,
+    subject_registry,
+)
+
+if TYPE_CHECKING:
+    from flippy.context import EvaluationCache
+
+# The columns of a `Rollout` needed to evaluate a flag: (subject path, enable percentage)
+RolloutValues = Tuple[str, float]
+# The same, along with the flag: (flag id, subject path, enable percentage)
+RolloutRow = Tuple[str, str, float]
+
+
+class Rule:
+    """A compiled rollout: enables the flag for a fraction of a subject's instances."""
+
+    __slots__ = ("subject_path", "subject", "enable_percentage", "enable_fraction")
+
+    def __init__(self, subject_path: str, subject: Subject, enable_percentage: float):
+        self.subject_path = subject_path
+        self.subject = subject
+        self.enable_percentage = enable_percentage
+        self.enable_fraction = enable_percentage / 100
+
+    def get_value(
+        self, flag_id: str, obj: Any, cache: Optional["EvaluationCache"] = None
+    ) -> Optional[bool]:
+        """
+        Returns the flag state determined by this rule for a given request or object.
+
+        Returns None in case the object doesn't match the rule's subject.
+        Subject identifiers are memoized in the `cache`, if one is given.
+        """
+        if cache is not None:
+            identifier = cache.get_identifier(self.subject, obj)
+        else:
+            identifier = build_identifier(self.subject, obj)
+        return self._get_value_for_identifier(flag_id, identifier)
+
+    async def aget_value(
+        self, flag_id: str, obj: Any, cache: Optional["EvaluationCache"] = None
+    ) -> Optional[bool]:
+        if cache is not None:
+            identifier = await cache.aget_identifier(self.subject, obj)
+        else:
+            identifier = await abuild_identifier(self.subject, obj)
+        return self._get_value_for_identifier(flag_id, identifier)
+
+    def _get_value_for_identifier(
+        self, flag_id: str, identifier: Optional[SubjectIdentifier]
+    ) -> Optional[bool]:
+        if identifier is None:
+            return None
+        # Scores are in range [0, 1), so there's no need to compute them at 0% and 100%.
+        if self.enable_fraction >= 1:
+            return True
+        if self.enable_fraction <= 0:
+            return False
+        return identifier.get_flag_score(flag_id) < self.enable_fraction
+
+    @property
+    def shadows_older_rules(self) -> bool:
+        return self.subject.always_matches
+
+    def __repr__(self) -> str:
+        return f"<Rule {self.subject_path} {self.enable_percentage}%>"
+
+
+class UnresolvedRule:
+    """A rollout whose subject couldn't be imported. Fails only when it's reached."""
+
+    __slots__ = ("subject_path", "enable_percentage", "error")
+
+    shadows_older_rules = False
+
+    def __init__(
+        self, subject_path: str, enable_percentage: float, error: ConfigurationError
+    ):
+        self.subject_path = subject_path
+        self.enable_percentage = enable_percentage
+        self.error = error
+
+    def get_value(
+        self, flag_id: str, obj: Any, cache: Optional["EvaluationCache"] = None
+    ) -> Optional[bool]:
+        raise self.error
+
+    async def aget_value(
+        self, flag_id: str, obj: Any, cache: Optional["EvaluationCache"] = None
+    ) -> Optional[bool]:
+        raise self.error
+
+    def __repr__(self) -> str:
+        return f"<UnresolvedRule {self.subject_path} {self.enable_percentage}%>"
+
+
+class DecisionPlan:
+    """
+    The rollouts of a flag, compiled for evaluation.
+
+    Rules are ordered from the newest. Rules that can never be reached are left out:
+    rollouts of a subject that already appears in a newer rollout,
+    and everything older than a rollout of a subject that matches every object.
+    """
+
+    __slots__ = ("flag_id", "rules")
+
+    def __init__(self, flag_id: str, rules: Tuple[Union[Rule, UnresolvedRule], ...]):
+        self.flag_id = flag_id
+        self.rules = rules
+
+    @classmethod
+    def compile(cls, flag_id: str, rollouts: Iterable[RolloutValues]) -> "DecisionPlan":
+        """Compile a plan from rollouts, starting from the newest."""
+        rules = []
+        seen_subject_paths = set()
+        for subject_path, enable_percentage in rollouts:
+            if subject_path in seen_subject_paths:
+                # A newer rollout of this subject always decides first.
+                continue
+            seen_subject_paths.add(subject_path)
+            rule: Union[Rule, UnresolvedRule]
+            try:
+                subject = subject_registry.get(subject_path)
+                rule = Rule(subject_path, subject, enable_percentage)
+            except ConfigurationError as e:
+                rule = UnresolvedRule(subject_path, enable_percentage, e)
+            rules.append(rule)
+            if rule.shadows_older_rules:
+                break
+        return cls(flag_id, tuple(rules))
+
+    def evaluate(
+        self, obj: Any, default: bool, cache: Optional["EvaluationCache"] = None
+    ) -> bool:
+        value = self.get_value(obj, cache)
+        return default if value is None else value
+
+    async def aevaluate(
+        self, obj: Any, default: bool, cache: Optional["EvaluationCache"] = None
+    ) -> bool:
+        value = await self.aget_value(obj, cache)
+        return default if value is None else value
+
+    def get_value(
+        self, obj: Any, cache: Optional["EvaluationCache"] = None
+    ) -> Optional[bool]:
+        """Return the value of the first rule matching the object, or None if no rule matches."""
+        for rule in self.rules:
+            maybe_value = rule.get_value(self.flag_id, obj, cache)
+            if maybe_value is not None:
+                return maybe_value
+            # Otherwise, ignore the particular rule - it doesn't match the object.
+        return None
+
+    async def aget_value(
+        self, obj: Any, cache: Optional["EvaluationCache"] = None
+    ) -> Optional[bool]:
+        for rule in self.rules:
+            maybe_value = await rule.aget_value(self.flag_id, obj, cache)
+            if maybe_value is not None:
+                return maybe_value
+        return None
+
+    @property
+    def is_constant(self) -> bool:
+        """True if the plan has no rules, so the flag always has its default value."""
+        return not self.rules
+
+    @property
+    def shape(self) -> Tuple[RolloutValues, ...]:
+        """The (subject path, enable percentage) of each rule: everything the flag states depend on besides the default."""
+        return tuple((rule.subject_path, rule.enable_percentage) for rule in self.rules)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def __repr__(self) -> str:
+        return f"<DecisionPlan {self.flag_id}: {list(self.rules)}>"
+
+
+def compile_plans(
+    rows: Iterable[RolloutRow], flag_ids: Iterable[str] = ()
+) -> Dict[str, DecisionPlan]:
+    """
+    Compile a plan for each flag from rollout rows, ordered from the newest.
+
+    Flags listed in `flag_ids` get a plan even if they don't have any rollouts.
+    """
+    rollouts_by_flag: Dict[str, List[RolloutValues]] = {
+        flag_id: [] for flag_id in flag_ids
+    }
+    for flag_id, subject_path, enable_percentage in rows:
+        rollouts_by_flag.setdefault(flag_id, []).append(
+            (subject_path, enable_percentage)
+        )
+    return {
+        flag_id: DecisionPlan.compile(flag_id, rollouts)
+        for flag_id, rollouts in rollouts_by_flag.items()
+    }
+
+
+def get_rollout_value(
+    flag_id: str,
+    subject_path: str,
+    enable_percentage: float,
+    obj: Any,
+    cache: Optional["EvaluationCache"] = None,
+) -> Optional[bool]:
+    """
+    Returns the flag state determined by a single rollout for a given request or object.
+
+    Returns None in case the object doesn't match the rollout's subject.
+    """
+    rule = Rule(subject_path, subject_registry.get(subject_path), enable_percentage)
+    return rule.get_value(flag_id, obj, cache)
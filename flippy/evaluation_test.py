@@ -0,0 +1,74 @@
+from typing import Optional
+
+import pytest
+from django.http import HttpRequest
+
+from .evaluation import DecisionPlan
+from .exceptions import ConfigurationError
+from .subject import Subject
+from .test_utils import request_factory, user_factory
+
+
+class EveryoneSubject(Subject):
+    always_matches = True
+
+    def get_identifier_for_request(self, request: HttpRequest) -> Optional[str]:
+        return "everyone"
+
+
+def test_plan_without_rollouts_is_constant():
+    plan = DecisionPlan.compile("hello", [])
+    assert plan.is_constant
+    assert len(plan) == 0
+    assert plan.evaluate(request_factory(), default=True) is True
+
+
+def test_plan_keeps_rollouts_in_order():
+    plan = DecisionPlan.compile(
+        "hello",
+        [("flippy.subject.UserSubject", 0), ("flippy.subject.IpAddressSubject", 100)],
+    )
+    assert plan.shape == (
+        ("flippy.subject.UserSubject", 0),
+        ("flippy.subject.IpAddressSubject", 100),
+    )
+    assert plan.evaluate(request_factory(), default=False) is True
+    assert plan.evaluate(request_factory(user=user_factory(1)), default=True) is False
+
+
+def test_plan_skips_rollouts_shadowed_by_same_subject():
+    plan = DecisionPlan.compile(
+        "hello",
+        [
+            ("flippy.subject.IpAddressSubject", 0),
+            ("flippy.subject.UserSubject", 100),
+            ("flippy.subject.IpAddressSubject", 100),
+        ],
+    )
+    assert plan.shape == (
+        ("flippy.subject.IpAddressSubject", 0),
+        ("flippy.subject.UserSubject", 100),
+    )
+
+
+def test_plan_skips_rollouts_older_than_subject_matching_everything():
+    plan = DecisionPlan.compile(
+        "hello",
+        [
+            ("flippy.subject.UserSubject", 100),
+            ("flippy.evaluation_test.EveryoneSubject", 0),
+            ("flippy.subject.IpAddressSubject", 100),
+        ],
+    )
+    assert len(plan) == 2
+    assert plan.evaluate(request_factory(), default=True) is False
+
+
+def test_plan_fails_on_unresolved_subject_only_when_reached():
+    plan = DecisionPlan.compile(
+        "hello",
+        [("flippy.subject.IpAddressSubject", 100), ("flippy.subject.Missing", 100)],
+    )
+    assert plan.evaluate(request_factory(), default=False) is True
+    with pytest.raises(ConfigurationError):
+        plan.evaluate(request_factory(ip=None), default=False)
@@ -0,0 +1,79 @@
+import json
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import RequestFactory
+
+from .admin import export_flag_states_csv
+from .export import format_csv, format_jsonl, iter_states
+from .flag import Flag, TypedFlag
+from .models import Rollout
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def flags():
+    enabled = TypedFlag[User]("enabled")
+    disabled = TypedFlag[User]("disabled")
+    TypedFlag[int]("numbers")
+    Flag("requests_only")
+    Rollout.objects.create(flag_id=enabled.id, subject="flippy.subject.UserSubject")
+    return enabled, disabled
+
+
+@pytest.fixture
+def users():
+    User.objects.bulk_create([User(username=f"user{i}") for i in range(5)])
+    return User.objects.order_by("pk")
+
+
+def test_iter_states_reads_rollouts_once(flags, users, django_assert_num_queries):
+    with django_assert_num_queries(2):
+        # The rollouts and the users
+        rows = list(iter_states(users, chunk_size=3))
+    pks = [str(pk) for pk in users.values_list("pk", flat=True)]
+    assert rows == [
+        row for pk in pks for row in [(pk, "disabled", False), (pk, "enabled", True)]
+    ]
+
+
+def test_iter_states_is_lazy(flags, users, django_assert_num_queries):
+    rows = iter_states(users, flags=[flags[0]], chunk_size=2)
+    with django_assert_num_queries(2):
+        next(rows)
+
+
+def test_formats():
+    rows = [("1", "hello", True), ("2", "hello", False)]
+    assert "".join(format_csv(rows)) == (
+        "subject_id,flag_id,state\r\n1,hello,True\r\n2,hello,False\r\n"
+    )
+    assert [json.loads(line) for line in format_jsonl(rows)] == [
+        {"subject_id": "1", "flag_id": "hello", "state": True},
+        {"subject_id": "2", "flag_id": "hello", "state": False},
+    ]
+
+
+def test_export_states_command(flags, users):
+    out = StringIO()
+    call_command("flippy_export_states", "enabled", "--format=jsonl", stdout=out)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert len(lines) == 5
+    assert all(line["flag_id"] == "enabled" and line["state"] for line in lines)
+
+
+def test_export_states_command_rejects_other_flags(flags):
+    with pytest.raises(Exception, match="not a typed flag of `User`"):
+        call_command("flippy_export_states", "numbers")
+
+
+def test_export_admin_action_streams_csv(flags, users):
+    response = export_flag_states_csv(None, RequestFactory().get("/"), users)
+    assert response.streaming
+    assert response["Content-Type"] == "text/csv"
+    content = b"".join(response.streaming_content).decode()
+    assert content.splitlines()[0] == "subject_id,flag_id,state"
+    assert len(content.splitlines()) == 11
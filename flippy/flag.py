@@ -1,17 +1,86 @@
+import asyncio
 import inspect
-from typing import TypeVar, Generic, TYPE_CHECKING, Any, Type, Optional, Iterable
+from typing import (
+    TypeVar,
+    Generic,
+    Any,
+    Type,
+    Optional,
+    Iterable,
+    Dict,
+    Sequence,
+    Collection,
+    Iterator,
+    Tuple,
+)
 
 from django.http import HttpRequest
 from django.utils.functional import LazyObject
 
+from .context import EvaluationCache, get_cache_for
+from .evaluation import DecisionPlan
+from .metrics import FlagCheck, get_recorder
 from .subject import Subject, TypedSubject
 
-if TYPE_CHECKING:
-    from flippy.models import Rollout
+T = TypeVar("T")
 
-flag_registry = []
 
-T = TypeVar("T")
+class FlagRegistry:
+    """All defined flags, indexed by id. Iterating yields the flags in definition order."""
+
+    def __init__(self) -> None:
+        self._flags: Dict[str, "Flag"] = {}
+        self._sorted_by_name: Optional[Tuple["Flag", ...]] = None
+        self._sorted_by_id: Optional[Tuple["Flag", ...]] = None
+
+    def register(self, flag: "Flag") -> None:
+        if flag.id in self._flags:
+            raise ValueError(f"Flag `{flag.id}` is already defined")
+        self._flags[flag.id] = flag
+        self._sorted_by_name = None
+        self._sorted_by_id = None
+
+    def unregister(self, flag_id: str) -> None:
+        del self._flags[flag_id]
+        self._sorted_by_name = None
+        self._sorted_by_id = None
+
+    def get(self, flag_id: str) -> Optional["Flag"]:
+        return self._flags.get(flag_id)
+
+    def sorted_by_name(self) -> Sequence["Flag"]:
+        flags = self._sorted_by_name
+        if flags is None:
+            flags = self._sorted_by_name = tuple(
+                sorted(self._flags.values(), key=lambda flag: flag.name)
+            )
+        return flags
+
+    def sorted_by_id(self) -> Sequence["Flag"]:
+        """The flags in an order that only depends on their ids, e.g. for indexing them in bitmaps."""
+        flags = self._sorted_by_id
+        if flags is None:
+            flags = self._sorted_by_id = tuple(
+                sorted(self._flags.values(), key=lambda flag: flag.id)
+            )
+        return flags
+
+    def clear(self) -> None:
+        self._flags = {}
+        self._sorted_by_name = None
+        self._sorted_by_id = None
+
+    def __iter__(self) -> Iterator["Flag"]:
+        return iter(list(self._flags.values()))
+
+    def __len__(self) -> int:
+        return len(self._flags)
+
+    def __contains__(self, flag_id: object) -> bool:
+        return flag_id in self._flags
+
+
+flag_registry = FlagRegistry()
 
 
 class Flag:
@@ -19,7 +88,7 @@ class Flag:
         self.id = id
         self.name = name or id.title()
         self.default = default
-        flag_registry.append(self)
+        flag_registry.register(self)
 
     def get_state_for_request(self, request: HttpRequest) -> bool:
         if not isinstance(request, HttpRequest):
@@ -38,21 +107,75 @@ class Flag:
         return error
 
     def _get_first_rollout_value(self, obj: Any) -> bool:
-        # Note: Flag is exported in __init__.py,
-        # -> don't import models at import time
-        from .models import Rollout
+        recorder = get_recorder()
+        check = recorder.start_check(self.id) if recorder is not None else None
+        cache = get_cache_for(obj)
+        if cache is None:
+            state = self._evaluate(obj, cache=None, check=check)
+        else:
+            state = cache.get_flag_state(
+                self, obj, lambda: self._evaluate(obj, cache, check=check)
+            )
+        if check is not None:
+            check.finish()
+        return state
+
+    def _evaluate(
+        self,
+        obj: Any,
+        cache: Optional[EvaluationCache],
+        plan: Optional[DecisionPlan] = None,
+        check: Optional[FlagCheck] = None,
+    ) -> bool:
+        if plan is None:
+            plan = self._get_plan()
+        if check is None:
+            return plan.evaluate(obj, self.default, cache)
+        value = plan.get_value(obj, cache)
+        check.set_value(value)
+        return self.default if value is None else value
+
+    def _get_plan(self) -> DecisionPlan:
+        """Return the compiled rollouts of this flag."""
+        return get_plans([self.id])[self.id]
 
-        matching_rollouts: Iterable[Rollout] = Rollout.objects.filter(
-            flag_id=self.id
-        ).order_by("-create_date")
+    async def aget_state_for_request(self, request: HttpRequest) -> bool:
+        """Async version of `get_state_for_request`, for use in async views."""
+        if not isinstance(request, HttpRequest):
+            raise self._type_error(
+                actual_type_name=type(request).__name__,
+                expected_type_name=HttpRequest.__name__,
+            )
+        return await self._aget_first_rollout_value(request)
 
-        for rollout in matching_rollouts:
-            maybe_value = rollout.get_flag_value(obj)
-            if maybe_value is not None:
-                return maybe_value
-            # Otherwise, ignore the particular rollout - it doesn't match the request.
+    async def _aget_first_rollout_value(self, obj: Any) -> bool:
+        recorder = get_recorder()
+        check = recorder.start_check(self.id) if recorder is not None else None
+        cache = get_cache_for(obj)
+        if cache is None:
+            state = await self._aevaluate(obj, cache=None, check=check)
+        else:
+            state = await cache.aget_flag_state(
+                self, obj, lambda: self._aevaluate(obj, cache, check=check)
+            )
+        if check is not None:
+            check.finish()
+        return state
 
-        return self.default
+    async def _aevaluate(
+        self,
+        obj: Any,
+        cache: Optional[EvaluationCache],
+        plan: Optional[DecisionPlan] = None,
+        check: Optional[FlagCheck] = None,
+    ) -> bool:
+        if plan is None:
+            plan = (await aget_plans([self.id]))[self.id]
+        if check is None:
+            return await plan.aevaluate(obj, self.default, cache)
+        value = await plan.aget_value(obj, cache)
+        check.set_value(value)
+        return self.default if value is None else value
 
     def accepts_subject(self, subject: Subject) -> bool:
         return True
@@ -60,10 +183,7 @@ class Flag:
 
 class TypedFlag(Flag, Generic[T]):
     def get_state_for_object(self, obj: T) -> bool:
-        if isinstance(obj, LazyObject):
-            # Compatibility for `request.user`
-            obj._setup()
-            obj = obj._wrapped
+        obj = _unwrap_lazy_object(obj)
         if not isinstance(obj, self.expected_type):
             raise self._type_error(
                 actual_type_name=type(obj).__name__,
@@ -72,6 +192,47 @@ class TypedFlag(Flag, Generic[T]):
 
         return self._get_first_rollout_value(obj)
 
+    async def aget_state_for_object(self, obj: T) -> bool:
+        """Async version of `get_state_for_object`."""
+        obj = _unwrap_lazy_object(obj)
+        if not isinstance(obj, self.expected_type):
+            raise self._type_error(
+                actual_type_name=type(obj).__name__,
+                expected_type_name=self.expected_type.__name__,
+            )
+
+        return await self._aget_first_rollout_value(obj)
+
+    def get_states_for_objects(
+        self, objects: Iterable[T], chunk_size: int = 2000
+    ) -> Iterator[Tuple[T, bool]]:
+        """
+        Evaluate the flag for many objects, yielding `(obj, state)` pairs.
+
+        The rollouts are loaded and their subjects are resolved only once.
+        Querysets are iterated in chunks of `chunk_size`, without caching the results,
+        so memory use doesn't grow with the number of objects.
+        """
+        from django.db.models import QuerySet
+
+        plan = self._get_plan()
+        if isinstance(objects, QuerySet):
+            objects = objects.iterator(chunk_size=chunk_size)
+        return self._iter_states(plan, objects)
+
+    def _iter_states(
+        self, plan: DecisionPlan, objects: Iterable[T]
+    ) -> Iterator[Tuple[T, bool]]:
+        expected_type = self.expected_type
+        for obj in objects:
+            obj = _unwrap_lazy_object(obj)
+            if not isinstance(obj, expected_type):
+                raise TypeError(
+                    f"`{self.id}.get_states_for_objects()` may only be called "
+                    f"with `{expected_type.__name__}` instances, not `{type(obj).__name__}`"
+                )
+            yield obj, plan.evaluate(obj, self.default)
+
     def accepts_subject(self, subject: Subject) -> bool:
         return isinstance(subject, TypedSubject) and subject.is_supported_type(
             self.expected_type
@@ -87,3 +248,156 @@ class TypedFlag(Flag, Generic[T]):
         # Instead, the actual generic type `TypingFlag[T]` is accessible on the instance:
         generic_class_type = self.__orig_class__
         return generic_class_type.__args__[0]
+
+
+def evaluate_all(
+    request: HttpRequest, flag_ids: Optional[Collection[str]] = None
+) -> Dict[str, bool]:
+    """
+    Return the state of every flag (or only the given flags) for a request.
+
+    All rollouts are fetched at once and each subject identifies the request only once.
+    """
+    _check_request_type(request, function_name="evaluate_all")
+    flags = _select_flags(flag_ids)
+    return _evaluate_flags(flags, request)
+
+
+def evaluate_all_for_object(
+    obj: Any, flag_ids: Optional[Collection[str]] = None
+) -> Dict[str, bool]:
+    """
+    Return the state of every typed flag that supports the object's type
+    (or only the given flags) for an object.
+    """
+    obj = _unwrap_lazy_object(obj)
+    flags = _select_flags_for_object(obj, flag_ids)
+    return _evaluate_flags(flags, obj)
+
+
+async def aevaluate_all(
+    request: HttpRequest, flag_ids: Optional[Collection[str]] = None
+) -> Dict[str, bool]:
+    """Async version of `evaluate_all`. The flags are evaluated concurrently."""
+    _check_request_type(request, function_name="aevaluate_all")
+    flags = _select_flags(flag_ids)
+    return await _aevaluate_flags(flags, request)
+
+
+async def aevaluate_all_for_object(
+    obj: Any, flag_ids: Optional[Collection[str]] = None
+) -> Dict[str, bool]:
+    """Async version of `evaluate_all_for_object`. The flags are evaluated concurrently."""
+    obj = _unwrap_lazy_object(obj)
+    flags = _select_flags_for_object(obj, flag_ids)
+    return await _aevaluate_flags(flags, obj)
+
+
+def load_flags() -> None:
+    """
+    Register the flags defined in the code, for commands running outside of a request.
+
+    Flags are registered when the modules defining them are imported: this imports
+    the `flags` module of each installed app, then the URLconf and the views it imports.
+    """
+    from django.urls import get_resolver
+    from django.utils.module_loading import autodiscover_modules
+
+    autodiscover_modules("flags")
+    get_resolver().url_patterns
+
+
+def _check_request_type(request: Any, function_name: str) -> None:
+    if not isinstance(request, HttpRequest):
+        raise TypeError(
+            f"`{function_name}()` may only be called with `HttpRequest` instances, "
+            f"not `{type(request).__name__}`"
+        )
+
+
+def _select_flags(flag_ids: Optional[Collection[str]]) -> Sequence[Flag]:
+    if flag_ids is None:
+        return list(flag_registry)
+    flags = []
+    for flag_id in flag_ids:
+        flag = flag_registry.get(flag_id)
+        if flag is None:
+            raise ValueError(f"Flag `{flag_id}` does not exist")
+        flags.append(flag)
+    return flags
+
+
+def _select_flags_for_object(
+    obj: Any, flag_ids: Optional[Collection[str]]
+) -> Sequence[Flag]:
+    if flag_ids is None:
+        return [
+            flag
+            for flag in flag_registry
+            if isinstance(flag, TypedFlag) and isinstance(obj, flag.expected_type)
+        ]
+    flags = _select_flags(flag_ids)
+    for flag in flags:
+        if not isinstance(flag, TypedFlag) or not isinstance(obj, flag.expected_type):
+            raise TypeError(
+                f"Flag `{flag.id}` cannot be evaluated "
+                f"for `{type(obj).__name__}` instances"
+            )
+    return flags
+
+
+def _evaluate_flags(flags: Sequence[Flag], obj: Any) -> Dict[str, bool]:
+    cache = get_cache_for(obj) or EvaluationCache()
+    plans: Optional[Dict[str, DecisionPlan]] = None
+
+    def evaluate(flag: Flag) -> bool:
+        nonlocal plans
+        if plans is None:
+            # Only fetched if some flag's state isn't known to the cache yet.
+            plans = get_plans([flag.id for flag in flags])
+        return flag._evaluate(obj, cache, plans[flag.id])
+
+    return {
+        flag.id: cache.get_flag_state(flag, obj, lambda: evaluate(flag))
+        for flag in flags
+    }
+
+
+async def _aevaluate_flags(flags: Sequence[Flag], obj: Any) -> Dict[str, bool]:
+    cache = get_cache_for(obj) or EvaluationCache()
+    missing_flag_ids = [
+        flag.id for flag in flags if not cache.has_flag_state(flag, obj)
+    ]
+    plans = await aget_plans(missing_flag_ids) if missing_flag_ids else {}
+
+    async def evaluate(flag: Flag) -> bool:
+        return await cache.aget_flag_state(
+            flag, obj, lambda: flag._aevaluate(obj, cache, plans[flag.id])
+        )
+
+    states = await asyncio.gather(*(evaluate(flag) for flag in flags))
+    return {flag.id: state for flag, state in zip(flags, states)}
+
+
+def get_plans(flag_ids: Collection[str]) -> Dict[str, DecisionPlan]:
+    """Return the compiled rollouts of each flag, fetching them in one go."""
+    # Note: Flag is exported in __init__.py,
+    # -> don't import models (or anything that does) at import time
+    from .store import get_store
+
+    return get_store().get_plans(flag_ids)
+
+
+async def aget_plans(flag_ids: Collection[str]) -> Dict[str, DecisionPlan]:
+    """Async version of `get_plans`."""
+    from .store import get_store
+
+    return await get_store().aget_plans(flag_ids)
+
+
+def _unwrap_lazy_object(obj: Any) -> Any:
+    if isinstance(obj, LazyObject):
+        # Compatibility for `request.user`
+        obj._setup()
+        obj = obj._wrapped
+    return obj
@@ -1,11 +1,23 @@
+import sys
+
 import pytest
+from asgiref.sync import async_to_sync
 from django.contrib.auth.models import User, AbstractUser
 from django.http import HttpRequest
 from django.utils.functional import SimpleLazyObject
 from pytest import raises
 
 from flippy.subject import IpAddressSubject, UserSubject
-from .flag import Flag, TypedFlag
+from .flag import (
+    Flag,
+    TypedFlag,
+    aevaluate_all,
+    aevaluate_all_for_object,
+    evaluate_all,
+    evaluate_all_for_object,
+    flag_registry,
+    load_flags,
+)
 from .models import Rollout
 from .test_utils import request_factory
 
@@ -17,6 +29,53 @@ def test_flag_has_name():
     assert f.id == "hello"
 
 
+def test_flag_is_registered():
+    f = Flag("hello")
+    assert flag_registry.get("hello") is f
+    assert "hello" in flag_registry
+    assert list(flag_registry) == [f]
+
+
+def test_flag_ids_must_be_unique():
+    Flag("hello")
+    with raises(ValueError, match="Flag `hello` is already defined"):
+        Flag("hello", name="Another hello")
+
+
+def test_flag_registry_sorted_by_name():
+    b = Flag("b", name="Bravo")
+    a = Flag("a", name="Alpha")
+    assert list(flag_registry) == [b, a]
+    assert list(flag_registry.sorted_by_name()) == [a, b]
+    c = Flag("c", name="Charlie")
+    assert list(flag_registry.sorted_by_name()) == [a, b, c]
+
+
+def test_flag_registry_unregister():
+    b = Flag("b", name="Alpha")
+    a = Flag("a", name="Bravo")
+    assert list(flag_registry.sorted_by_id()) == [a, b]
+    flag_registry.unregister("a")
+    assert "a" not in flag_registry
+    assert list(flag_registry.sorted_by_id()) == [b]
+    assert list(flag_registry.sorted_by_name()) == [b]
+
+
+def test_load_flags_imports_flags_modules(tmp_path, monkeypatch, settings):
+    app = tmp_path / "flags_app"
+    app.mkdir()
+    (app / "__init__.py").write_text("")
+    (app / "flags.py").write_text("from flippy import Flag\n\nflag = Flag('hello')\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    settings.INSTALLED_APPS = [*settings.INSTALLED_APPS, "flags_app"]
+    try:
+        load_flags()
+        assert "hello" in flag_registry
+    finally:
+        sys.modules.pop("flags_app.flags", None)
+        sys.modules.pop("flags_app", None)
+
+
 def test_flag_is_false_by_default():
     f = Flag("hello")
     assert f.get_state_for_request(request_factory()) is False
@@ -85,6 +144,17 @@ def test_flag_uses_latest_rollout():
     assert f.get_state_for_request(request_factory()) is False
 
 
+def test_flag_fetches_only_needed_columns(django_assert_num_queries):
+    f = Flag("hello")
+    Rollout.objects.create(flag_id=f.id, subject="flippy.subject.IpAddressSubject")
+    with django_assert_num_queries(1) as captured:
+        f.get_state_for_request(request_factory())
+    select_clause = captured.captured_queries[0]["sql"].split(" FROM ")[0]
+    assert "subject" in select_clause
+    assert "enable_percentage" in select_clause
+    assert "create_date" not in select_clause
+
+
 def test_flag_disallows_calling_with_unrelated_type():
     f = Flag("hello")
 
@@ -150,3 +220,149 @@ def test_flag_accepts_any_subject():
 def test_typed_flag_accepts_matching_subjects(flag_type, subject_cls, expected):
     f = TypedFlag[flag_type]("hello")
     assert f.accepts_subject(subject_cls()) is expected
+
+
+def test_evaluate_all_returns_state_of_each_flag():
+    Flag("all_hello")
+    Flag("all_hello2", default=True)
+    Flag("all_hello3")
+    Rollout.objects.create(
+        flag_id="all_hello3", subject="flippy.subject.IpAddressSubject"
+    )
+    states = evaluate_all(request_factory())
+    assert states["all_hello"] is False
+    assert states["all_hello2"] is True
+    assert states["all_hello3"] is True
+
+
+def test_evaluate_all_uses_one_query(django_assert_num_queries):
+    flags = [Flag(f"all_hello{i}") for i in range(10)]
+    for f in flags:
+        Rollout.objects.create(flag_id=f.id, subject="flippy.subject.IpAddressSubject")
+    with django_assert_num_queries(1):
+        states = evaluate_all(request_factory(), [f.id for f in flags])
+    assert states == {f.id: True for f in flags}
+
+
+def test_evaluate_all_for_subset_of_flags():
+    Flag("all_hello")
+    Flag("all_hello2")
+    assert evaluate_all(request_factory(), ["all_hello2"]) == {"all_hello2": False}
+
+
+def test_evaluate_all_rejects_missing_flag():
+    with raises(ValueError, match="Flag `missing_id` does not exist"):
+        evaluate_all(request_factory(), ["missing_id"])
+
+
+def test_evaluate_all_disallows_calling_with_unrelated_type():
+    with raises(TypeError, match="may only be called with `HttpRequest` instances"):
+        evaluate_all(User())
+
+
+def test_evaluate_all_for_object_only_includes_matching_flags():
+    Flag("all_hello")
+    TypedFlag[int]("all_hello_int")
+    TypedFlag[User]("all_hello_user")
+    Rollout.objects.create(
+        flag_id="all_hello_user", subject="flippy.subject.UserSubject"
+    )
+    states = evaluate_all_for_object(SimpleLazyObject(lambda: User(pk=1)))
+    assert states["all_hello_user"] is True
+    assert "all_hello" not in states
+    assert "all_hello_int" not in states
+
+
+def test_evaluate_all_for_object_rejects_unrelated_flag():
+    TypedFlag[int]("all_hello_int")
+    with raises(TypeError, match="Flag `all_hello_int` cannot be evaluated for `User`"):
+        evaluate_all_for_object(User(pk=1), ["all_hello_int"])
+
+
+def test_typed_flag_states_for_objects():
+    f = TypedFlag[User]("hello")
+    Rollout.objects.create(
+        flag_id=f.id, subject="flippy.subject.UserSubject", enable_percentage=50
+    )
+    users = [User(pk=pk) for pk in range(20)]
+    states = list(f.get_states_for_objects(users))
+    assert states == [(user, f.get_state_for_object(user)) for user in users]
+    assert {state for _, state in states} == {True, False}
+
+
+def test_typed_flag_states_for_queryset(django_assert_num_queries):
+    f = TypedFlag[User]("hello")
+    Rollout.objects.create(flag_id=f.id, subject="flippy.subject.UserSubject")
+    for i in range(5):
+        User.objects.create(username=f"user{i}")
+    with django_assert_num_queries(2):
+        states = list(f.get_states_for_objects(User.objects.order_by("pk")))
+    assert [state for _, state in states] == [True] * 5
+
+
+def test_typed_flag_states_for_objects_uses_default():
+    f = TypedFlag[User]("hello", default=True)
+    assert list(f.get_states_for_objects([User(pk=1)])) == [(User(pk=1), True)]
+
+
+def test_typed_flag_states_for_objects_disallows_unrelated_type():
+    f = TypedFlag[User]("hello")
+    with raises(
+        TypeError,
+        match=r"`hello\.get_states_for_objects\(\)` may only be called with `User` instances",
+    ):
+        list(f.get_states_for_objects([1]))
+
+
+@pytest.mark.parametrize(
+    "percentage,result", [(0, False), (10, False), (20, True), (100, True)]
+)
+def test_flag_async_uses_rollout(percentage, result):
+    f = Flag("hello")
+    Rollout.objects.create(
+        flag_id=f.id,
+        enable_percentage=percentage,
+        subject="flippy.subject.IpAddressSubject",
+    )
+    assert async_to_sync(f.aget_state_for_request)(request_factory()) is result
+
+
+def test_flag_async_uses_default():
+    f = Flag("hello", default=True)
+    assert async_to_sync(f.aget_state_for_request)(request_factory()) is True
+
+
+def test_flag_async_disallows_calling_with_unrelated_type():
+    f = Flag("hello")
+    with raises(
+        TypeError,
+        match=r"`hello\.aget_state_for_request\(\)` may only be called with `HttpRequest` instances",
+    ):
+        async_to_sync(f.aget_state_for_request)("hello")
+
+
+def test_typed_flag_async_allows_calling_with_object():
+    f: TypedFlag[User] = TypedFlag[User]("hello")
+    Rollout.objects.create(flag_id=f.id, subject="flippy.subject.UserSubject")
+    user = SimpleLazyObject(lambda: User(pk=1))
+    assert async_to_sync(f.aget_state_for_object)(user) is True
+
+
+def test_aevaluate_all_matches_evaluate_all(django_assert_num_queries):
+    flags = [Flag(f"hello{i}") for i in range(10)]
+    for i, f in enumerate(flags):
+        Rollout.objects.create(
+            flag_id=f.id,
+            subject="flippy.subject.IpAddressSubject",
+            enable_percentage=i * 10,
+        )
+    request = request_factory()
+    with django_assert_num_queries(1):
+        states = async_to_sync(aevaluate_all)(request)
+    assert states == evaluate_all(request)
+
+
+def test_aevaluate_all_for_object():
+    TypedFlag[User]("hello")
+    Rollout.objects.create(flag_id="hello", subject="flippy.subject.UserSubject")
+    assert async_to_sync(aevaluate_all_for_object)(User(pk=1)) == {"hello": True}
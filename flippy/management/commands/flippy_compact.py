@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from flippy.compaction import DEFAULT_BATCH_SIZE, compact
+from flippy.flag import flag_registry, load_flags
+from flippy.models import ArchivedRollout
+
+
+class Command(BaseCommand):
+    help = "Move rollouts that can no longer affect any flag to the archive table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many rollouts would be archived.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="How many rollouts to archive per transaction.",
+        )
+        parser.add_argument(
+            "--archive-missing-flags",
+            action="store_true",
+            help=(
+                "Also archive the rollouts of flags which aren't defined in code. "
+                "Only flags defined in modules imported by the URLconf count as defined."
+            ),
+        )
+
+    def handle(self, *args, dry_run, batch_size, archive_missing_flags, **options):
+        load_flags()
+        include_missing_flags = archive_missing_flags
+        if include_missing_flags and not len(flag_registry):
+            self.stderr.write(
+                "No flags are defined, so the rollouts of missing flags are kept."
+            )
+            include_missing_flags = False
+        result = compact(
+            batch_size=batch_size,
+            include_missing_flags=include_missing_flags,
+            dry_run=dry_run,
+        )
+        verb = "Would archive" if dry_run else "Archived"
+        reasons = dict(ArchivedRollout.REASON_CHOICES)
+        for reason, count in result.archived.items():
+            self.stdout.write(f"{verb} {count} rollouts: {reasons[reason].lower()}")
+        self.stdout.write(
+            f"{verb} {result.total_archived} rollouts in total, {result.remaining} remaining."
+        )
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from flippy.snapshot import fetch_primary_rows
+from flippy.snapshot_file import write_snapshot_file
+
+
+class Command(BaseCommand):
+    help = "Write the rollouts from the database to a snapshot file, to be read by `flippy.store.FileStore`."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            help="Where to write the file. Defaults to the FLIPPY_SNAPSHOT_FILE setting.",
+        )
+
+    def handle(self, *args, path=None, **options):
+        path = path or getattr(settings, "FLIPPY_SNAPSHOT_FILE", None)
+        if path is None:
+            raise CommandError("Pass a path or set FLIPPY_SNAPSHOT_FILE")
+        # Workers keep the file until the next export, so don't read a replica that may lag behind.
+        version = write_snapshot_file(path, fetch_primary_rows())
+        self.stdout.write(f"Wrote snapshot {version} to {path}")
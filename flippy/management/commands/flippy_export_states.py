@@ -0,0 +1,43 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from flippy.export import DEFAULT_CHUNK_SIZE, FORMATS, get_flags_for_model, iter_states
+from flippy.flag import flag_registry, load_flags
+
+
+class Command(BaseCommand):
+    help = "Write the state of every typed flag for every instance of a model, as (subject_id, flag_id, state) rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "flag_ids",
+            nargs="*",
+            help="The flags to export. Defaults to all flags of the model.",
+        )
+        parser.add_argument(
+            "--model",
+            default="auth.User",
+            help="The model to export the states for, as app_label.ModelName.",
+        )
+        parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, flag_ids, model, format, chunk_size, **options):
+        load_flags()
+        try:
+            model_class = apps.get_model(model)
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e)) from e
+        flags = get_flags_for_model(model_class)
+        if flag_ids:
+            for flag_id in flag_ids:
+                if flag_registry.get(flag_id) not in flags:
+                    raise CommandError(
+                        f"`{flag_id}` is not a typed flag of `{model_class.__name__}`"
+                    )
+            flags = [flag for flag in flags if flag.id in flag_ids]
+        rows = iter_states(
+            model_class._default_manager.all(), flags, chunk_size=chunk_size
+        )
+        for line in FORMATS[format](rows):
+            self.stdout.write(line, ending="")
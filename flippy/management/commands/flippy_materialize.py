@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+
+from flippy.cohort import DEFAULT_BATCH_SIZE, materialize
+from flippy.flag import TypedFlag, flag_registry, load_flags
+
+
+class Command(BaseCommand):
+    help = "Store the states of typed flags for all objects of their model, updating the previous results."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "flag_ids",
+            nargs="*",
+            help="The flags to materialize. Defaults to all flags of model instances.",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Evaluate all objects again, rather than only the changes.",
+        )
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, flag_ids, full, batch_size, **options):
+        load_flags()
+        if flag_ids:
+            flags = []
+            for flag_id in flag_ids:
+                flag = flag_registry.get(flag_id)
+                if not isinstance(flag, TypedFlag):
+                    raise CommandError(f"`{flag_id}` is not a typed flag")
+                flags.append(flag)
+        else:
+            flags = [
+                flag
+                for flag in flag_registry.sorted_by_name()
+                if isinstance(flag, TypedFlag)
+                and isinstance(flag.expected_type, type)
+                and issubclass(flag.expected_type, models.Model)
+            ]
+        for flag in flags:
+            try:
+                result = materialize(flag, batch_size=batch_size, full=full)
+            except TypeError as e:
+                raise CommandError(str(e)) from e
+            self.stdout.write(
+                f"{flag.id}: evaluated {result.evaluated} objects, "
+                f"updated {result.updated}, removed {result.removed}"
+            )
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from flippy.flag import load_flags
+from flippy.metrics import MemorySink, create_sink, format_prometheus
+
+
+class Command(BaseCommand):
+    help = "Print the flag metrics collected by the configured FLIPPY_METRICS_SINK."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            dest="output_format",
+            choices=["table", "prometheus"],
+            default="table",
+            help="Print a summary table, or the metrics in the Prometheus text format.",
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Clear the metrics after printing them.",
+        )
+
+    def handle(self, *args, output_format, reset, **options):
+        load_flags()
+        sink = create_sink()
+        if isinstance(sink, MemorySink):
+            self.stderr.write(
+                "MemorySink only holds the metrics of the process that collected them. "
+                "Use flippy.metrics.CacheSink to read them from here, "
+                "or fetch them from the metrics view."
+            )
+        try:
+            totals = sink.read()
+        except NotImplementedError as e:
+            raise CommandError(str(e)) from e
+        if output_format == "prometheus":
+            self.stdout.write(format_prometheus(totals), ending="")
+        else:
+            self._write_table(totals)
+        if reset:
+            sink.clear()
+
+    def _write_table(self, totals):
+        row = "{:<30} {:>10} {:>10} {:>10} {:>10} {:>9} {:>10} {:>10}"
+        self.stdout.write(
+            row.format(
+                "flag", "checks", "true", "false", "default", "cached", "mean", "p95"
+            )
+        )
+        by_checks = sorted(totals.items(), key=lambda item: -item[1].checks)
+        for flag_id, stats in by_checks:
+            if not stats.checks:
+                continue
+            self.stdout.write(
+                row.format(
+                    flag_id,
+                    stats.checks,
+                    stats.outcomes["true"],
+                    stats.outcomes["false"],
+                    stats.outcomes["default"],
+                    f"{stats.cache_hit_ratio:.1%}",
+                    _format_seconds(stats.seconds / stats.checks),
+                    "<=" + _format_seconds(stats.get_latency_quantile(0.95)),
+                )
+            )
+
+
+def _format_seconds(seconds: float) -> str:
+    if seconds == float("inf"):
+        return "inf"
+    if seconds < 0.001:
+        return f"{seconds * 1_000_000:.0f}µs"
+    return f"{seconds * 1000:.1f}ms"
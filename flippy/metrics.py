@@ -0,0 +1,393 @@
+"""
+Per-flag evaluation metrics: how often each flag is checked, with which outcome, and how long it takes.
+
+Enabled with `FLIPPY_METRICS = True`. Each thread counts the checks it makes in its own buffer,
+and the buffers of all threads are handed over to the sink every `FLIPPY_METRICS_FLUSH_INTERVAL` seconds
+(on the next check after that) and when the process exits.
+The sink is selected with `FLIPPY_METRICS_SINK`, a dotted path to a `MetricsSink` subclass:
+
+- `MemorySink` (the default) keeps the totals in the memory of each process,
+- `CacheSink` adds them up in the Django cache `FLIPPY_METRICS_CACHE`, shared by all processes.
+
+The totals are exposed in the Prometheus text format by `flippy.views.metrics`,
+and printed by `manage.py flippy_stats`.
+"""
+
+import atexit
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from .exceptions import ConfigurationError
+
+# The outcomes of a flag check. "default" if no rollout matched the object,
+# "cached" if the state was already known to the evaluation cache.
+TRUE = "true"
+FALSE = "false"
+DEFAULT = "default"
+CACHED = "cached"
+OUTCOMES = (TRUE, FALSE, DEFAULT, CACHED)
+
+# Upper bounds of the latency histogram buckets, in seconds. Slower checks go to an extra bucket.
+LATENCY_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+)
+
+
+def get_outcome(value: Optional[bool]) -> str:
+    """Return the outcome of an evaluation, given the value of the first matching rule."""
+    if value is None:
+        return DEFAULT
+    return TRUE if value else FALSE
+
+
+class FlagStats:
+    """Counts of the checks of a flag, by outcome, and a histogram of their latencies."""
+
+    __slots__ = ("outcomes", "buckets", "seconds")
+
+    def __init__(self) -> None:
+        self.outcomes: Dict[str, int] = dict.fromkeys(OUTCOMES, 0)
+        self.buckets: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.seconds = 0.0
+
+    def add(self, outcome: str, seconds: float) -> None:
+        self.outcomes[outcome] += 1
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.seconds += seconds
+
+    def merge(self, other: "FlagStats") -> None:
+        for outcome, count in other.outcomes.items():
+            self.outcomes[outcome] += count
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.seconds += other.seconds
+
+    @property
+    def checks(self) -> int:
+        return sum(self.buckets)
+
+    @property
+    def evaluations(self) -> int:
+        """The checks which weren't answered by the evaluation cache."""
+        return self.checks - self.outcomes[CACHED]
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        checks = self.checks
+        return self.outcomes[CACHED] / checks if checks else 0.0
+
+    def get_latency_quantile(self, quantile: float) -> float:
+        """Return the upper bound of the bucket holding the given quantile (inf for the slowest bucket)."""
+        threshold = quantile * self.checks
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen and seen >= threshold:
+                return bound
+        return float("inf")
+
+    def get_counters(self) -> Iterator[Tuple[str, int]]:
+        """Yield the stats as integer counters, the latency sum in microseconds."""
+        yield from self.outcomes.items()
+        for i, count in enumerate(self.buckets):
+            yield f"bucket_{i}", count
+        yield "microseconds", round(self.seconds * 1_000_000)
+
+    @classmethod
+    def from_counters(cls, counters: Mapping[str, int]) -> "FlagStats":
+        stats = cls()
+        for outcome in OUTCOMES:
+            stats.outcomes[outcome] = counters.get(outcome, 0)
+        stats.buckets = [
+            counters.get(f"bucket_{i}", 0) for i in range(len(stats.buckets))
+        ]
+        stats.seconds = counters.get("microseconds", 0) / 1_000_000
+        return stats
+
+
+class MetricsSink(ABC):
+    @abstractmethod
+    def flush(self, stats: Mapping[str, FlagStats]) -> None:
+        """Add the stats collected by a thread since its previous flush, by flag id."""
+        ...
+
+    def read(self) -> Dict[str, FlagStats]:
+        """Return the total stats of each flag."""
+        raise NotImplementedError(f"{type(self).__name__} can't be read back")
+
+    def clear(self) -> None:
+        """Forget the stats collected so far."""
+        raise NotImplementedError(f"{type(self).__name__} can't be cleared")
+
+
+class MemorySink(MetricsSink):
+    """Keeps the totals in memory. Each process only knows about its own checks."""
+
+    def __init__(self) -> None:
+        self._totals: Dict[str, FlagStats] = {}
+        self._lock = threading.Lock()
+
+    def flush(self, stats: Mapping[str, FlagStats]) -> None:
+        with self._lock:
+            for flag_id, flag_stats in stats.items():
+                self._totals.setdefault(flag_id, FlagStats()).merge(flag_stats)
+
+    def read(self) -> Dict[str, FlagStats]:
+        with self._lock:
+            totals = {}
+            for flag_id, flag_stats in self._totals.items():
+                totals[flag_id] = FlagStats()
+                totals[flag_id].merge(flag_stats)
+            return totals
+
+    def clear(self) -> None:
+        with self._lock:
+            self._totals = {}
+
+
+class CacheSink(MetricsSink):
+    """
+    Adds the totals up in the cache `FLIPPY_METRICS_CACHE` (from `CACHES`), shared by all processes.
+
+    Each counter is a separate cache key, incremented atomically if the cache backend supports it.
+    Only the flags defined in code are read back.
+    """
+
+    COUNTER_KEY = "flippy:metrics:{flag_id}:{counter}"
+
+    def __init__(self) -> None:
+        self.cache_alias = getattr(settings, "FLIPPY_METRICS_CACHE", "default")
+
+    def flush(self, stats: Mapping[str, FlagStats]) -> None:
+        cache = caches[self.cache_alias]
+        for flag_id, flag_stats in stats.items():
+            for counter, value in flag_stats.get_counters():
+                if value:
+                    key = self.COUNTER_KEY.format(flag_id=flag_id, counter=counter)
+                    cache.add(key, 0, timeout=None)
+                    try:
+                        cache.incr(key, value)
+                    except ValueError:
+                        # Evicted since it was added.
+                        cache.set(key, value, timeout=None)
+
+    def read(self) -> Dict[str, FlagStats]:
+        from .flag import flag_registry
+
+        cache = caches[self.cache_alias]
+        counter_names = [counter for counter, _ in FlagStats().get_counters()]
+        totals = {}
+        for flag in flag_registry.sorted_by_id():
+            keys = {
+                self.COUNTER_KEY.format(flag_id=flag.id, counter=counter): counter
+                for counter in counter_names
+            }
+            values = cache.get_many(list(keys))
+            if values:
+                totals[flag.id] = FlagStats.from_counters(
+                    {keys[key]: value for key, value in values.items()}
+                )
+        return totals
+
+    def clear(self) -> None:
+        from .flag import flag_registry
+
+        counter_names = [counter for counter, _ in FlagStats().get_counters()]
+        caches[self.cache_alias].delete_many(
+            [
+                self.COUNTER_KEY.format(flag_id=flag.id, counter=counter)
+                for flag in flag_registry
+                for counter in counter_names
+            ]
+        )
+
+
+class FlagCheck:
+    """A flag check being measured. Its outcome is CACHED unless the flag gets evaluated."""
+
+    __slots__ = ("recorder", "flag_id", "outcome", "start")
+
+    def __init__(self, recorder: "MetricsRecorder", flag_id: str) -> None:
+        self.recorder = recorder
+        self.flag_id = flag_id
+        self.outcome = CACHED
+        self.start = time.perf_counter()
+
+    def set_value(self, value: Optional[bool]) -> None:
+        """Record the value of the first matching rule, or None if none matched."""
+        self.outcome = get_outcome(value)
+
+    def finish(self) -> None:
+        self.recorder.record(
+            self.flag_id, self.outcome, time.perf_counter() - self.start
+        )
+
+
+class _ThreadBuffer:
+    """The checks recorded by one thread since the last flush."""
+
+    __slots__ = ("thread", "stats", "lock")
+
+    def __init__(self) -> None:
+        self.thread = threading.current_thread()
+        self.stats: Dict[str, FlagStats] = {}
+        # Only contended while the buffer is being flushed.
+        self.lock = threading.Lock()
+
+
+class MetricsRecorder:
+    """
+    Collects the flag checks of each thread, and flushes them to the sink periodically.
+
+    A flush is triggered by the first check made after `flush_interval`, in any thread,
+    and hands over the checks of all threads, including idle ones. Remaining checks are flushed at exit.
+    """
+
+    def __init__(self, sink: MetricsSink, flush_interval: float = 10.0):
+        self.sink = sink
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._buffers: List[_ThreadBuffer] = []
+        self._buffers_lock = threading.Lock()
+        self._flush_time = time.monotonic()
+
+    def start_check(self, flag_id: str) -> FlagCheck:
+        return FlagCheck(self, flag_id)
+
+    def record(self, flag_id: str, outcome: str, seconds: float) -> None:
+        try:
+            buffer = self._local.buffer
+        except AttributeError:
+            buffer = self._local.buffer = self._add_buffer()
+        with buffer.lock:
+            try:
+                flag_stats = buffer.stats[flag_id]
+            except KeyError:
+                flag_stats = buffer.stats[flag_id] = FlagStats()
+            flag_stats.add(outcome, seconds)
+        if time.monotonic() - self._flush_time >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Hand the checks recorded by all threads over to the sink."""
+        self._flush_time = time.monotonic()
+        with self._buffers_lock:
+            buffers = list(self._buffers)
+        totals: Dict[str, FlagStats] = {}
+        for buffer in buffers:
+            with buffer.lock:
+                stats, buffer.stats = buffer.stats, {}
+            for flag_id, flag_stats in stats.items():
+                totals.setdefault(flag_id, FlagStats()).merge(flag_stats)
+        with self._buffers_lock:
+            # Forget finished threads, now that their checks are flushed.
+            self._buffers = [
+                buffer for buffer in self._buffers if buffer.thread.is_alive()
+            ]
+        if totals:
+            self.sink.flush(totals)
+
+    def _add_buffer(self) -> _ThreadBuffer:
+        buffer = _ThreadBuffer()
+        with self._buffers_lock:
+            self._buffers.append(buffer)
+        return buffer
+
+
+def create_sink() -> MetricsSink:
+    path = getattr(settings, "FLIPPY_METRICS_SINK", "flippy.metrics.MemorySink")
+    try:
+        cls = import_string(path)
+    except ImportError as e:
+        raise ConfigurationError(str(e)) from e
+    if not (isinstance(cls, type) and issubclass(cls, MetricsSink)):
+        raise ConfigurationError(f"{cls} should be a subclass of MetricsSink")
+    return cls()
+
+
+_configured = False
+_recorder: Optional[MetricsRecorder] = None
+
+
+def get_recorder() -> Optional[MetricsRecorder]:
+    """Return the recorder for flag checks, or None if metrics are disabled."""
+    global _configured, _recorder
+    if not _configured:
+        _recorder = _create_recorder()
+        _configured = True
+    return _recorder
+
+
+def _create_recorder() -> Optional[MetricsRecorder]:
+    if not getattr(settings, "FLIPPY_METRICS", False):
+        return None
+    flush_interval = getattr(settings, "FLIPPY_METRICS_FLUSH_INTERVAL", 10.0)
+    recorder = MetricsRecorder(create_sink(), flush_interval=flush_interval)
+    atexit.register(recorder.flush)
+    return recorder
+
+
+def format_prometheus(totals: Mapping[str, FlagStats]) -> str:
+    """Format the stats of each flag in the Prometheus text exposition format."""
+    lines = [
+        "# HELP flippy_flag_checks_total Flag checks, by outcome.",
+        "# TYPE flippy_flag_checks_total counter",
+    ]
+    for flag_id, stats in sorted(totals.items()):
+        label = _format_label_value(flag_id)
+        for outcome, count in stats.outcomes.items():
+            lines.append(
+                f'flippy_flag_checks_total{{flag="{label}",outcome="{outcome}"}} {count}'
+            )
+    lines += [
+        "# HELP flippy_flag_check_seconds Time taken by flag checks.",
+        "# TYPE flippy_flag_check_seconds histogram",
+    ]
+    for flag_id, stats in sorted(totals.items()):
+        label = _format_label_value(flag_id)
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), stats.buckets):
+            cumulative += count
+            lines.append(
+                f'flippy_flag_check_seconds_bucket{{flag="{label}",le="{bound}"}} {cumulative}'
+            )
+        lines.append(f'flippy_flag_check_seconds_sum{{flag="{label}"}} {stats.seconds}')
+        lines.append(f'flippy_flag_check_seconds_count{{flag="{label}"}} {cumulative}')
+    return "\n".join(lines) + "\n"
+
+
+def _format_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def on_setting_changed(setting: str, **kwargs) -> None:
+    global _configured, _recorder
+    if setting in (
+        "FLIPPY_METRICS",
+        "FLIPPY_METRICS_SINK",
+        "FLIPPY_METRICS_FLUSH_INTERVAL",
+        "FLIPPY_METRICS_CACHE",
+    ):
+        if _recorder is not None:
+            atexit.unregister(_recorder.flush)
+        _configured = False
+        _recorder = None
@@ -0,0 +1,202 @@
+import threading
+from io import StringIO
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+
+from . import metrics
+from .context import evaluation_cache
+from .flag import Flag, TypedFlag
+from .metrics import FlagStats, MemorySink, MetricsRecorder
+from .models import Rollout
+from .test_utils import request_factory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def metrics_enabled(settings):
+    settings.FLIPPY_METRICS = True
+    settings.FLIPPY_METRICS_FLUSH_INTERVAL = 0
+
+
+@pytest.fixture
+def flag():
+    f = Flag("hello")
+    Rollout.objects.create(flag_id=f.id, subject="flippy.subject.IpAddressSubject")
+    return f
+
+
+def read_totals():
+    recorder = metrics.get_recorder()
+    recorder.flush()
+    return recorder.sink.read()
+
+
+def test_metrics_are_disabled_by_default(flag):
+    assert metrics.get_recorder() is None
+    assert flag.get_state_for_request(request_factory()) is True
+
+
+def test_outcomes_are_counted(metrics_enabled, flag):
+    other = Flag("other")
+    Rollout.objects.create(
+        flag_id=other.id, subject="flippy.subject.UserSubject", enable_percentage=0
+    )
+    assert flag.get_state_for_request(request_factory()) is True
+    assert flag.get_state_for_request(request_factory(ip="")) is False
+    assert other.get_state_for_request(request_factory()) is False
+    totals = read_totals()
+    assert totals["hello"].outcomes == {
+        "true": 1,
+        "false": 0,
+        "default": 1,
+        "cached": 0,
+    }
+    # Anonymous users aren't identified by UserSubject.
+    assert totals["other"].outcomes["default"] == 1
+    assert totals["hello"].checks == 2
+    assert totals["hello"].seconds > 0
+
+
+def test_cache_hits_are_counted(metrics_enabled, flag):
+    request = request_factory()
+    with evaluation_cache(request):
+        for _ in range(4):
+            assert flag.get_state_for_request(request) is True
+    stats = read_totals()["hello"]
+    assert stats.evaluations == 1
+    assert stats.outcomes["cached"] == 3
+    assert stats.cache_hit_ratio == 0.75
+
+
+def test_object_and_async_checks_are_counted(metrics_enabled):
+    f = TypedFlag[User]("hello")
+    Rollout.objects.create(flag_id=f.id, subject="flippy.subject.UserSubject")
+    user = User(pk=1)
+    assert f.get_state_for_object(user) is True
+    assert async_to_sync(f.aget_state_for_object)(user) is True
+    assert read_totals()["hello"].outcomes["true"] == 2
+
+
+def test_checks_are_flushed_periodically():
+    sink = MemorySink()
+    recorder = MetricsRecorder(sink, flush_interval=60)
+    recorder.record("hello", metrics.TRUE, 0.001)
+    assert sink.read() == {}
+    recorder.flush()
+    assert sink.read()["hello"].checks == 1
+
+
+def test_threads_aggregate_separately():
+    sink = MemorySink()
+    recorder = MetricsRecorder(sink, flush_interval=60)
+
+    def check():
+        for _ in range(100):
+            recorder.record("hello", metrics.FALSE, 0.001)
+        recorder.flush()
+
+    threads = [threading.Thread(target=check) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sink.read()["hello"].outcomes["false"] == 400
+
+
+def test_idle_threads_are_flushed_by_others():
+    sink = MemorySink()
+    recorder = MetricsRecorder(sink, flush_interval=60)
+    thread = threading.Thread(target=recorder.record, args=("hello", "true", 0.001))
+    thread.start()
+    thread.join()
+    recorder.flush()
+    assert sink.read()["hello"].checks == 1
+    # The finished thread's buffer is dropped once flushed.
+    assert recorder._buffers == []
+
+
+def test_latency_histogram():
+    stats = FlagStats()
+    for seconds in [0.000005] * 90 + [0.003] * 9 + [10]:
+        stats.add(metrics.TRUE, seconds)
+    assert stats.buckets[0] == 90
+    assert stats.buckets[-1] == 1
+    assert stats.get_latency_quantile(0.5) == 0.00001
+    assert stats.get_latency_quantile(0.95) == 0.005
+    assert stats.get_latency_quantile(1) == float("inf")
+
+
+def test_prometheus_format():
+    stats = FlagStats()
+    stats.add(metrics.TRUE, 0.00002)
+    stats.add(metrics.CACHED, 1)
+    lines = metrics.format_prometheus({"hello": stats}).splitlines()
+    assert 'flippy_flag_checks_total{flag="hello",outcome="true"} 1' in lines
+    assert 'flippy_flag_checks_total{flag="hello",outcome="cached"} 1' in lines
+    assert 'flippy_flag_check_seconds_bucket{flag="hello",le="1e-05"} 0' in lines
+    assert 'flippy_flag_check_seconds_bucket{flag="hello",le="2.5e-05"} 1' in lines
+    assert 'flippy_flag_check_seconds_bucket{flag="hello",le="+Inf"} 2' in lines
+    assert 'flippy_flag_check_seconds_count{flag="hello"} 2' in lines
+
+
+def test_metrics_view(client, metrics_enabled, flag):
+    flag.get_state_for_request(request_factory())
+    response = client.get("/internal/flippy/metrics/")
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain")
+    assert b'flippy_flag_checks_total{flag="hello",outcome="true"} 1' in (
+        response.content
+    )
+
+
+def test_metrics_view_is_disabled_by_default(client):
+    assert client.get("/internal/flippy/metrics/").status_code == 404
+
+
+def test_metrics_view_is_not_public(client, metrics_enabled):
+    assert client.get("/flippy/metrics/").status_code == 404
+
+
+@pytest.fixture
+def cache_sink(metrics_enabled, settings):
+    settings.FLIPPY_METRICS_SINK = "flippy.metrics.CacheSink"
+    cache = caches["default"]
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def test_cache_sink_adds_up_flushes(cache_sink, flag):
+    flag.get_state_for_request(request_factory())
+    metrics.get_recorder().flush()
+    flag.get_state_for_request(request_factory())
+    stats = metrics.create_sink().read()["hello"]
+    assert stats.outcomes["true"] == 2
+    assert stats.seconds > 0
+
+
+def test_stats_command(cache_sink, flag):
+    flag.get_state_for_request(request_factory())
+    out = StringIO()
+    call_command("flippy_stats", "--reset", stdout=out)
+    header, row = out.getvalue().splitlines()
+    assert row.split()[:6] == ["hello", "1", "1", "0", "0", "0.0%"]
+    assert metrics.create_sink().read() == {}
+
+
+def test_stats_command_prometheus_format(cache_sink, flag):
+    flag.get_state_for_request(request_factory())
+    out = StringIO()
+    call_command("flippy_stats", "--format", "prometheus", stdout=out)
+    assert 'flippy_flag_checks_total{flag="hello",outcome="true"} 1' in out.getvalue()
+
+
+def test_recorder_is_reset_on_setting_change(settings):
+    assert metrics.get_recorder() is None
+    settings.FLIPPY_METRICS = True
+    assert isinstance(metrics.get_recorder(), MetricsRecorder)
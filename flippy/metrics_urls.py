@@ -0,0 +1,13 @@
+"""
+The Prometheus metrics view, kept apart from `flippy.urls` as it's meant for internal use only.
+
+Mount it where only your monitoring can reach it, e.g. `path("internal/flippy/", include("flippy.metrics_urls"))`.
+"""
+
+from django.urls import path
+
+from . import views
+
+app_name = "flippy_metrics"
+
+urlpatterns = [path("metrics/", views.metrics, name="metrics")]
@@ -0,0 +1,86 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from . import persistence
+from .context import evaluation_cache
+from .variants import (
+    add_variant_headers,
+    aget_variant_key,
+    get_variant_key,
+    set_variant_key,
+)
+
+
+class FlippyMiddleware:
+    """
+    Evaluate each flag and each subject at most once per request.
+
+    With `FLIPPY_PERSIST_STATES` set, the states are also reused in later requests (see `flippy.persistence`).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mode = persistence.get_mode()
+        with evaluation_cache(request) as cache:
+            if mode is None:
+                return self.get_response(request)
+            persisted = persistence.load_states(request, cache, mode)
+            response = self.get_response(request)
+            persistence.save_states(request, response, cache, mode, persisted)
+            return response
+
+    async def __acall__(self, request):
+        mode = persistence.get_mode()
+        with evaluation_cache(request) as cache:
+            if mode is None:
+                return await self.get_response(request)
+            # The session, the user and the store version may all need the database.
+            persisted = await sync_to_async(persistence.load_states)(
+                request, cache, mode
+            )
+            response = await self.get_response(request)
+            await sync_to_async(persistence.save_states)(
+                request, response, cache, mode, persisted
+            )
+            return response
+
+
+class FlippyVariantMiddleware:
+    """
+    Compute the variant key of each request (see `flippy.variants`) and add it to the response.
+
+    Place it between Django's `UpdateCacheMiddleware` and `FetchFromCacheMiddleware`
+    to cache a separate copy of each page per variant.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key = get_variant_key(request)
+        set_variant_key(request, key)
+        response = self.get_response(request)
+        add_variant_headers(response, key)
+        return response
+
+    async def __acall__(self, request):
+        key = await aget_variant_key(request)
+        set_variant_key(request, key)
+        response = await self.get_response(request)
+        add_variant_headers(response, key)
+        return response
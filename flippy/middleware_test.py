@@ -0,0 +1,23 @@
+import asyncio
+
+from .context import get_cache_for
+from .middleware import FlippyMiddleware
+from .test_utils import request_factory
+
+
+def test_middleware_provides_cache_during_request():
+    def view(request):
+        assert get_cache_for(request) is not None
+        return "response"
+
+    request = request_factory()
+    assert FlippyMiddleware(view)(request) == "response"
+
+
+def test_middleware_provides_cache_during_async_request():
+    async def view(request):
+        assert get_cache_for(request) is not None
+        return "response"
+
+    request = request_factory()
+    assert asyncio.run(FlippyMiddleware(view)(request)) == "response"
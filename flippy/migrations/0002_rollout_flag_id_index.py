@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("flippy", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="rollout",
+            index=models.Index(
+                fields=["flag_id", "-create_date"], name="flippy_rollout_flag_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("flippy", "0002_rollout_flag_id_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RolloutChange",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("flag_id", models.CharField(max_length=64)),
+                ("create_date", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("flippy", "0003_rolloutchange"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedRollout",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("rollout_id", models.IntegerField()),
+                ("flag_id", models.CharField(max_length=64)),
+                ("subject", models.TextField()),
+                ("enable_percentage", models.FloatField()),
+                ("create_date", models.DateTimeField()),
+                ("archive_date", models.DateTimeField(auto_now_add=True)),
+                (
+                    "reason",
+                    models.CharField(
+                        choices=[
+                            ("superseded", "Superseded by a newer rollout"),
+                            ("missing_flag", "Flag no longer exists"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("flippy", "0004_archivedrollout"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Cohort",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("flag_id", models.CharField(max_length=64, unique=True)),
+                ("plan", models.TextField(default="[]")),
+                ("default", models.BooleanField(default=False)),
+                ("update_date", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="CohortAssignment",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("object_id", models.CharField(max_length=64)),
+                ("decided_by", models.CharField(blank=True, max_length=255)),
+                ("score", models.FloatField(null=True)),
+                ("enabled", models.BooleanField()),
+                (
+                    "cohort",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="assignments",
+                        to="flippy.cohort",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["cohort", "decided_by", "score"],
+                        name="flippy_cohort_score_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("cohort", "object_id"),
+                        name="flippy_cohort_object_unique",
+                    )
+                ],
+            },
+        ),
+    ]
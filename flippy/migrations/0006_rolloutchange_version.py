@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:09
+
+from django.db import migrations, models
+
+
+def number_existing_changes(apps, schema_editor):
+    # Existing changes keep their ids as versions, and new ones continue from there.
+    RolloutChange = apps.get_model("flippy", "RolloutChange")
+    RolloutChangeCounter = apps.get_model("flippy", "RolloutChangeCounter")
+    db_alias = schema_editor.connection.alias
+    changes = RolloutChange.objects.using(db_alias)
+    changes.update(version=models.F("id"))
+    last_id = changes.aggregate(last_id=models.Max("id"))["last_id"] or 0
+    RolloutChangeCounter.objects.using(db_alias).create(pk=1, value=last_id)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("flippy", "0005_cohort"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RolloutChangeCounter",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("value", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="rolloutchange",
+            name="version",
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(number_existing_changes, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,41 @@
 from datetime import datetime
-from typing import Optional, Any
+from typing import Optional, Any, Iterable, Set, TYPE_CHECKING
 
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
-from django.http import HttpRequest
+from django.db import models, router, transaction
 
 from flippy import Flag
 from flippy.flag import flag_registry, TypedFlag
-from .subject import import_and_instantiate_subject, SubjectIdentifier, TypedSubject
+from .evaluation import RolloutRow, get_rollout_value
+from .exceptions import ConfigurationError
+from .subject import Subject, subject_registry
+
+if TYPE_CHECKING:
+    from .context import EvaluationCache
+
+
+class RolloutQuerySet(models.QuerySet):
+    def for_evaluation(self) -> "models.QuerySet[RolloutRow]":
+        """Only the columns needed to evaluate flags, starting from the newest rollout."""
+        return self.order_by("-create_date").values_list(
+            "flag_id", "subject", "enable_percentage"
+        )
+
+    def current(self) -> "RolloutQuerySet":
+        """
+        Only the newest rollout of each flag and subject, i.e. the ones that can still decide a flag's state.
+
+        It's a single query, using a correlated subquery on the (flag_id, -create_date) index.
+        """
+        newest = (
+            Rollout.objects.filter(
+                flag_id=models.OuterRef("flag_id"), subject=models.OuterRef("subject")
+            )
+            .order_by("-create_date", "-id")
+            .values("id")[:1]
+        )
+        return self.filter(id=models.Subquery(newest))
 
 
 class Rollout(models.Model):
@@ -21,47 +48,68 @@ class Rollout(models.Model):
     )
     create_date: datetime = models.DateTimeField(auto_now_add=True)
 
+    objects = RolloutQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Used to find the rollouts of a flag, starting from the newest.
+            models.Index(
+                fields=["flag_id", "-create_date"], name="flippy_rollout_flag_id_idx"
+            )
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the original flag, in case it's changed before saving.
+        instance._loaded_flag_id = instance.__dict__.get("flag_id")
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_flag_id = self.flag_id
+
+    def get_changed_flag_ids(self) -> Set[str]:
+        """Return the flags affected by saving or deleting this rollout."""
+        flag_ids = {self.flag_id}
+        loaded_flag_id = getattr(self, "_loaded_flag_id", None)
+        if loaded_flag_id is not None:
+            flag_ids.add(loaded_flag_id)
+        return flag_ids
+
     @property
     def enable_fraction(self):
         fraction = self.enable_percentage / 100
         assert 0 <= fraction <= 1
         return fraction
 
-    def get_flag_value(self, obj: Any) -> Optional[bool]:
+    def get_flag_value(
+        self, obj: Any, cache: Optional["EvaluationCache"] = None
+    ) -> Optional[bool]:
         """
         Returns the flag state assigned determined by this rollout to a given request.
 
         Returns None in case the request doesn't match the rollout's subject.
+        Subject identifiers are memoized in the `cache`, if one is given.
         """
-        identifier = self._build_identifier(obj)
-        if not identifier:
-            return None
-        score = identifier.get_flag_score(self.flag_id)
-        return score < self.enable_fraction
-
-    def _build_identifier(self, obj: Any) -> Optional[SubjectIdentifier]:
-        subject = self.subject_obj
-        if isinstance(obj, HttpRequest):
-            subject_id = subject.get_identifier_for_request(obj)
-        else:
-            assert isinstance(subject, TypedSubject)  # TODO handle this gracefully
-            subject_id = subject.get_identifier_for_object(obj)
-        if subject_id is None:
-            return None
-        return SubjectIdentifier(subject.subject_class, subject_id)
+        return get_rollout_value(
+            self.flag_id, self.subject, self.enable_percentage, obj, cache
+        )
 
     @property
-    def subject_obj(self):
-        subject = import_and_instantiate_subject(self.subject)
-        return subject
+    def subject_obj(self) -> Subject:
+        return subject_registry.get(self.subject)
 
     @property
     def subject_name(self):
-        return str(self.subject_obj)
+        try:
+            return str(self.subject_obj)
+        except ConfigurationError:
+            return f"<missing subject: `{self.subject}`>"
 
     @property
     def _flag_obj(self) -> Optional[Flag]:
-        return next((f for f in flag_registry if f.id == self.flag_id), None)
+        return flag_registry.get(self.flag_id)
 
     @property
     def flag_name(self):
@@ -78,3 +126,132 @@ class Rollout(models.Model):
             if isinstance(flag, TypedFlag):
                 message += f" It can only be used with subjects that support `{flag.expected_type.__name__}`."
             raise ValidationError(message)
+
+
+class RolloutChangeCounter(models.Model):
+    """
+    A single row handing out the versions of `RolloutChange`s.
+
+    Writers lock it until their transaction commits, so versions become visible in the order they're handed out,
+    unlike autoincrement ids: a poller that has seen version 11 can't miss a version 10 committed later.
+    """
+
+    value: int = models.BigIntegerField(default=0)
+
+
+class RolloutChange(models.Model):
+    """
+    An append-only log of changes to rollouts, written when a rollout is saved or deleted.
+
+    The versions let caches find out which flags changed since they were loaded.
+    """
+
+    flag_id: str = models.CharField(max_length=64)
+    create_date: datetime = models.DateTimeField(auto_now_add=True)
+    version: int = models.BigIntegerField(default=0, db_index=True)
+
+    @classmethod
+    def record(cls, flag_ids: Iterable[str], using: Optional[str] = None) -> None:
+        flag_ids = list(flag_ids)
+        if not flag_ids:
+            return
+        if using is None:
+            using = router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            # The lock is held until the outermost transaction commits.
+            counter, _ = (
+                RolloutChangeCounter.objects.using(using)
+                .select_for_update()
+                .get_or_create(pk=1)
+            )
+            counter.value += 1
+            counter.save(update_fields=["value"])
+            cls.objects.using(using).bulk_create(
+                [cls(flag_id=flag_id, version=counter.value) for flag_id in flag_ids]
+            )
+
+    @classmethod
+    def get_current_version(cls, using: Optional[str] = None) -> int:
+        changes = cls.objects.using(using)
+        return changes.aggregate(version=models.Max("version"))["version"] or 0
+
+    @classmethod
+    def get_changed_flag_ids(
+        cls, since_version: int, until_version: int, using: Optional[str] = None
+    ) -> Set[str]:
+        changes = cls.objects.using(using).filter(
+            version__gt=since_version, version__lte=until_version
+        )
+        return set(changes.values_list("flag_id", flat=True))
+
+
+class ArchivedRollout(models.Model):
+    """A rollout moved out of the `Rollout` table by `manage.py flippy_compact`, kept for the audit trail."""
+
+    SUPERSEDED = "superseded"
+    MISSING_FLAG = "missing_flag"
+    REASON_CHOICES = [
+        (SUPERSEDED, "Superseded by a newer rollout"),
+        (MISSING_FLAG, "Flag no longer exists"),
+    ]
+
+    rollout_id: int = models.IntegerField()
+    flag_id: str = models.CharField(max_length=64)
+    subject: str = models.TextField()
+    enable_percentage: float = models.FloatField()
+    create_date: datetime = models.DateTimeField()
+    archive_date: datetime = models.DateTimeField(auto_now_add=True)
+    reason: str = models.CharField(max_length=16, choices=REASON_CHOICES)
+
+    @classmethod
+    def from_rollout(cls, rollout: Rollout, reason: str) -> "ArchivedRollout":
+        return cls(
+            rollout_id=rollout.id,
+            flag_id=rollout.flag_id,
+            subject=rollout.subject,
+            enable_percentage=rollout.enable_percentage,
+            create_date=rollout.create_date,
+            reason=reason,
+        )
+
+
+class Cohort(models.Model):
+    """
+    The materialized states of a typed flag for all objects of its type, maintained by `manage.py flippy_materialize`.
+
+    Remembers the rollouts the assignments were computed from, so that they can be updated incrementally.
+    """
+
+    flag_id: str = models.CharField(max_length=64, unique=True)
+    # The `DecisionPlan.shape` and flag default the assignments reflect, as JSON
+    plan: str = models.TextField(default="[]")
+    default: bool = models.BooleanField(default=False)
+    update_date: datetime = models.DateTimeField(auto_now=True)
+
+
+class CohortAssignment(models.Model):
+    """The state of a flag for a single object, along with the rollout that decided it."""
+
+    cohort: Cohort = models.ForeignKey(
+        Cohort, on_delete=models.CASCADE, related_name="assignments"
+    )
+    object_id: str = models.CharField(max_length=64)
+    # The subject of the rollout that decided the state, or "" if the flag has its default value
+    decided_by: str = models.CharField(max_length=255, blank=True)
+    # The object's score for the flag, as determined by the deciding subject
+    score: Optional[float] = models.FloatField(null=True)
+    enabled: bool = models.BooleanField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["cohort", "object_id"], name="flippy_cohort_object_unique"
+            )
+        ]
+        indexes = [
+            # Used to find the assignments affected by a changed enable percentage.
+            models.Index(
+                fields=["cohort", "decided_by", "score"],
+                name="flippy_cohort_score_idx",
+            )
+        ]
@@ -0,0 +1,138 @@
+"""
+Reusing the flag states evaluated for a visitor in their later requests.
+
+With `FLIPPY_PERSIST_STATES = "cookie"` (or `"session"`), `flippy.middleware.FlippyMiddleware`
+stores the states of the flags evaluated during a request in a signed cookie (or in the session).
+Later requests of the same visitor reuse them without loading rollouts or identifying subjects,
+as long as the rollouts, the defined flags and the logged in user are the same.
+
+The states are bit-packed by the index of each flag in the registry,
+so the cookie stays small, e.g. `3f2a9c1e.1a.12` (a stamp, the known flags and their states).
+
+Note that the states stick with the visitor until the rollouts change, even if a subject
+would identify them differently meanwhile (e.g. because of a new IP address).
+"""
+
+import hashlib
+from typing import Dict, Hashable, NamedTuple, Optional
+
+from django.conf import settings
+from django.core import signing
+from django.http import HttpRequest, HttpResponse
+
+from .context import EvaluationCache
+from .exceptions import ConfigurationError
+from .flag import flag_registry
+from .store import get_store
+
+COOKIE = "cookie"
+SESSION = "session"
+SESSION_KEY = "_flippy_states"
+COOKIE_SALT = "flippy.persistence"
+
+
+class PersistedStates(NamedTuple):
+    # Identifies the rollouts, flags and user the states were evaluated with
+    stamp: str
+    # What the request came with, to only store the states again if they changed
+    payload: Optional[str]
+
+
+def get_mode() -> Optional[str]:
+    mode = getattr(settings, "FLIPPY_PERSIST_STATES", None)
+    if mode not in (None, COOKIE, SESSION):
+        raise ConfigurationError(
+            f"FLIPPY_PERSIST_STATES should be `{COOKIE}` or `{SESSION}`, not `{mode}`"
+        )
+    return mode
+
+
+def get_cookie_name() -> str:
+    return getattr(settings, "FLIPPY_STATES_COOKIE_NAME", "flippy_states")
+
+
+def get_stamp(request: HttpRequest, version: Hashable) -> str:
+    user = getattr(request, "user", None)
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    digest = hashlib.sha1()
+    digest.update(repr(version).encode())
+    digest.update(
+        repr(
+            [(flag.id, flag.default) for flag in flag_registry.sorted_by_id()]
+        ).encode()
+    )
+    digest.update(repr(user_id).encode())
+    return digest.hexdigest()[:8]
+
+
+def encode_states(stamp: str, states: Dict[str, bool]) -> str:
+    known = enabled = 0
+    for index, flag in enumerate(flag_registry.sorted_by_id()):
+        try:
+            state = states[flag.id]
+        except KeyError:
+            continue
+        known |= 1 << index
+        if state:
+            enabled |= 1 << index
+    return f"{stamp}.{known:x}.{enabled:x}"
+
+
+def decode_states(payload: str, stamp: str) -> Dict[str, bool]:
+    """Return the states stored in the payload, or nothing if they're outdated or malformed."""
+    try:
+        payload_stamp, known_hex, enabled_hex = payload.split(".")
+        known, enabled = int(known_hex, 16), int(enabled_hex, 16)
+    except ValueError:
+        return {}
+    if payload_stamp != stamp:
+        return {}
+    return {
+        flag.id: bool(enabled & (1 << index))
+        for index, flag in enumerate(flag_registry.sorted_by_id())
+        if known & (1 << index)
+    }
+
+
+def load_states(
+    request: HttpRequest, cache: EvaluationCache, mode: str
+) -> PersistedStates:
+    """Provide the cache with the states stored by previous requests."""
+    stamp = get_stamp(request, get_store().get_version())
+    if mode == COOKIE:
+        payload = request.get_signed_cookie(
+            get_cookie_name(), default=None, salt=COOKIE_SALT
+        )
+    else:
+        payload = request.session.get(SESSION_KEY)
+    if payload is not None:
+        for flag_id, state in decode_states(payload, stamp).items():
+            cache.set_flag_state(flag_id, request, state)
+    return PersistedStates(stamp, payload)
+
+
+def save_states(
+    request: HttpRequest,
+    response: HttpResponse,
+    cache: EvaluationCache,
+    mode: str,
+    persisted: PersistedStates,
+) -> None:
+    """Store the states of the flags evaluated during the request, if any have changed."""
+    states = cache.get_flag_states(request)
+    if not states:
+        return
+    payload = encode_states(persisted.stamp, states)
+    if payload == persisted.payload:
+        return
+    if mode == COOKIE:
+        response.set_signed_cookie(
+            get_cookie_name(),
+            payload,
+            salt=COOKIE_SALT,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite="Lax",
+        )
+    else:
+        request.session[SESSION_KEY] = payload
@@ -0,0 +1,116 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from .flag import Flag, flag_registry
+from .middleware import FlippyMiddleware
+from .models import Rollout
+from .persistence import decode_states, encode_states
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def flag():
+    f = Flag("hello")
+    Flag("other")
+    Flag("unused")
+    Rollout.objects.create(flag_id=f.id, subject="flippy.subject.IpAddressSubject")
+    return f
+
+
+@pytest.fixture
+def handler(flag):
+    other = flag_registry.get("other")
+
+    def view(request):
+        states = [f.get_state_for_request(request) for f in (flag, other)]
+        return HttpResponse(repr(states))
+
+    return FlippyMiddleware(view)
+
+
+def get(has_ip=True):
+    request = RequestFactory().get("/")
+    if not has_ip:
+        del request.META["REMOTE_ADDR"]
+    return request
+
+
+def test_states_are_bit_packed_by_registry_index(flag):
+    payload = encode_states("abcd1234", {"hello": True, "other": False})
+    # Flags sorted by id: hello, other, unused
+    assert payload == "abcd1234.3.1"
+    assert decode_states(payload, "abcd1234") == {"hello": True, "other": False}
+
+
+@pytest.mark.parametrize("payload", ["abcd1234.3", "abcd1234.x.1", "eeee0000.3.1"])
+def test_outdated_or_malformed_states_are_ignored(flag, payload):
+    assert decode_states(payload, "abcd1234") == {}
+
+
+def test_cookie_persistence(flag, handler, settings, django_assert_num_queries):
+    settings.FLIPPY_PERSIST_STATES = "cookie"
+    response = handler(get())
+    assert response.content == b"[True, False]"
+    cookie = response.cookies["flippy_states"]
+    assert cookie["httponly"]
+
+    request = get(has_ip=False)
+    request.COOKIES["flippy_states"] = cookie.value
+    with django_assert_num_queries(1):
+        # Only the version of the rollouts
+        response = handler(request)
+    # The visitor keeps the states they've been given.
+    assert response.content == b"[True, False]"
+    assert "flippy_states" not in response.cookies
+
+
+def test_states_are_evaluated_again_after_rollouts_change(flag, handler, settings):
+    settings.FLIPPY_PERSIST_STATES = "cookie"
+    cookie = handler(get()).cookies["flippy_states"]
+    Rollout.objects.create(
+        flag_id=flag.id, subject="flippy.subject.IpAddressSubject", enable_percentage=0
+    )
+    request = get()
+    request.COOKIES["flippy_states"] = cookie.value
+    response = handler(request)
+    assert response.content == b"[False, False]"
+    assert response.cookies["flippy_states"].value != cookie.value
+
+
+def test_tampered_cookie_is_ignored(flag, handler, settings):
+    settings.FLIPPY_PERSIST_STATES = "cookie"
+    cookie = handler(get(has_ip=False)).cookies["flippy_states"]
+    request = get()
+    tampered = cookie.value.replace(".3.0:", ".3.1:")
+    assert tampered != cookie.value
+    request.COOKIES["flippy_states"] = tampered
+    assert handler(request).content == b"[True, False]"
+
+
+def test_session_persistence(flag, handler, settings):
+    settings.FLIPPY_PERSIST_STATES = "session"
+    request = get()
+    request.session = {}
+    handler(request)
+    session = request.session
+    assert session["_flippy_states"].endswith(".3.1")
+
+    request = get(has_ip=False)
+    request.session = session
+    assert handler(request).content == b"[True, False]"
+
+
+def test_async_persistence(flag, settings):
+    settings.FLIPPY_PERSIST_STATES = "cookie"
+
+    async def view(request):
+        return HttpResponse(repr(await flag.aget_state_for_request(request)))
+
+    handler = FlippyMiddleware(view)
+    cookie = async_to_sync(handler)(get()).cookies["flippy_states"]
+    request = get(has_ip=False)
+    request.COOKIES["flippy_states"] = cookie.value
+    assert async_to_sync(handler)(request).content == b"True"
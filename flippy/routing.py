@@ -0,0 +1,45 @@
+"""
+Database routing of the reads made to evaluate flags.
+
+With `FLIPPY_READ_DATABASE` set to a database alias (typically a read replica),
+flags read their rollouts from that database, while the admin and all writes keep using the default one.
+
+Replicas lag behind the primary, so a flag checked right after a rollout is saved could still see the old rollouts.
+With `FLIPPY_READ_YOUR_WRITES_WINDOW` set, reads go to the default database for that many seconds
+after a rollout is saved or deleted in the current process.
+"""
+
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+
+_last_write_time: Optional[float] = None
+
+
+def get_read_database() -> Optional[str]:
+    """Return the database alias to evaluate flags with, or None for the default routing."""
+    alias = getattr(settings, "FLIPPY_READ_DATABASE", None)
+    if alias is None:
+        return None
+    window = getattr(settings, "FLIPPY_READ_YOUR_WRITES_WINDOW", 0)
+    if _last_write_time is not None and time.monotonic() - _last_write_time < window:
+        return None
+    return alias
+
+
+def record_write() -> None:
+    global _last_write_time
+    _last_write_time = time.monotonic()
+
+
+def on_rollout_changed(sender, using: Optional[str] = None, **kwargs) -> None:
+    record_write()
+    # The replica can only catch up once the change is committed, so start the window again then.
+    transaction.on_commit(record_write, using=using)
+
+
+def reset() -> None:
+    global _last_write_time
+    _last_write_time = None
@@ -0,0 +1,109 @@
+from io import StringIO
+
+import pytest
+from django.core.cache import caches
+from django.core.management import call_command
+
+from . import routing, snapshot
+from .flag import Flag
+from .models import Rollout, RolloutChange
+from .snapshot_file import SnapshotFile
+from .test_utils import request_factory
+
+pytestmark = pytest.mark.django_db(databases=["default", "replica"])
+
+
+@pytest.fixture
+def replica(settings):
+    settings.FLIPPY_READ_DATABASE = "replica"
+    routing.reset()
+    yield
+    routing.reset()
+
+
+def create_rollout(flag_id, using="default"):
+    # bulk_create doesn't send signals, like a change replicated from elsewhere.
+    Rollout.objects.using(using).bulk_create(
+        [Rollout(flag_id=flag_id, subject="flippy.subject.IpAddressSubject")]
+    )
+
+
+def test_flags_are_read_from_default_database():
+    create_rollout("hello")
+    assert Flag("hello").get_state_for_request(request_factory()) is True
+
+
+def test_flags_are_read_from_replica(replica):
+    f = Flag("hello")
+    create_rollout(f.id)
+    assert f.get_state_for_request(request_factory()) is False
+    create_rollout(f.id, using="replica")
+    assert f.get_state_for_request(request_factory()) is True
+
+
+def test_admin_writes_go_to_default_database(replica):
+    Rollout.objects.create(flag_id="hello", subject="flippy.subject.IpAddressSubject")
+    assert Rollout.objects.count() == 1
+    assert Rollout.objects.using("replica").count() == 0
+
+
+def test_reads_own_writes_within_window(replica, settings):
+    settings.FLIPPY_READ_YOUR_WRITES_WINDOW = 60
+    f = Flag("hello")
+    assert f.get_state_for_request(request_factory()) is False
+    Rollout.objects.create(flag_id=f.id, subject="flippy.subject.IpAddressSubject")
+    assert routing.get_read_database() is None
+    assert f.get_state_for_request(request_factory()) is True
+
+
+def test_replica_is_used_again_after_window(replica, settings):
+    settings.FLIPPY_READ_YOUR_WRITES_WINDOW = 0
+    Rollout.objects.create(flag_id="hello", subject="flippy.subject.IpAddressSubject")
+    assert routing.get_read_database() == "replica"
+
+
+@pytest.fixture
+def shared_snapshot(replica, settings):
+    settings.FLIPPY_SNAPSHOT = True
+    settings.FLIPPY_SNAPSHOT_CACHE = "default"
+    settings.FLIPPY_READ_YOUR_WRITES_WINDOW = 0
+    cache = caches["default"]
+    cache.clear()
+    yield cache
+    cache.clear()
+    snapshot.reset()
+
+
+def test_published_snapshot_is_read_from_default_database(
+    shared_snapshot, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        Rollout.objects.create(
+            flag_id="hello", subject="flippy.subject.IpAddressSubject"
+        )
+    version = shared_snapshot.get(snapshot.CACHE_VERSION_KEY)
+    rows = shared_snapshot.get(snapshot.CACHE_ROWS_KEY.format(version=version))
+    assert rows == (("hello", "flippy.subject.IpAddressSubject", 100),)
+
+
+def test_seeded_snapshot_is_read_from_default_database(shared_snapshot):
+    create_rollout("hello")
+    loaded = snapshot.get_snapshot()
+    assert loaded.get_plan("hello").shape == (("flippy.subject.IpAddressSubject", 100),)
+
+
+def test_changes_are_logged_in_the_database_written_to():
+    Rollout.objects.using("replica").create(
+        flag_id="hello", subject="flippy.subject.IpAddressSubject"
+    )
+    assert RolloutChange.objects.using("replica").count() == 1
+    assert not RolloutChange.objects.exists()
+
+
+def test_snapshot_file_is_exported_from_default_database(replica, tmp_path):
+    path = str(tmp_path / "snapshot")
+    create_rollout("hello")
+    call_command("flippy_export_snapshot", path, stdout=StringIO())
+    assert SnapshotFile(path).get_rollouts("hello") == [
+        ("flippy.subject.IpAddressSubject", 100)
+    ]
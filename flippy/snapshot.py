@@ -0,0 +1,389 @@
+"""
+Process-local snapshot of all rollouts.
+
+When `FLIPPY_SNAPSHOT = True` is set in Django settings (or `FLIPPY_STORE` is `flippy.store.CachedStore`),
+flags are evaluated against an in-memory copy of the `Rollout` table
+instead of querying the database on each check.
+The snapshot is rebuilt when rollouts are saved or deleted,
+and additionally after `FLIPPY_SNAPSHOT_TTL` seconds (to pick up changes made by other processes).
+
+With `FLIPPY_SNAPSHOT_POLL_INTERVAL` set, the snapshot also checks the `RolloutChange` log
+at that interval, and only reloads the flags that have changed since.
+This lets other processes' changes be picked up quickly, without frequent full reloads.
+
+With `FLIPPY_SNAPSHOT_CACHE` set to a cache alias, the rollouts are also shared between
+processes through Django's cache framework: saving a rollout publishes a new version
+of all rollouts to the cache, and other processes fetch it from there instead of the database.
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+import uuid
+import weakref
+from typing import Dict, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import BaseCache, caches
+from django.db import router
+from django.utils.functional import cached_property
+
+from .evaluation import DecisionPlan, RolloutRow, compile_plans
+from .routing import get_read_database
+
+if TYPE_CHECKING:
+    from flippy.models import Rollout
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60.0
+
+CACHE_VERSION_KEY = "flippy:snapshot:version"
+CACHE_ROWS_KEY = "flippy:snapshot:rows:{version}"
+# Superseded versions aren't deleted, only left to expire.
+CACHE_ROWS_TIMEOUT = 24 * 60 * 60
+
+
+class RolloutSnapshot:
+    """An immutable view of all rollouts, compiled into a decision plan per flag."""
+
+    def __init__(
+        self,
+        plans: Dict[str, DecisionPlan],
+        generation: int,
+        load_time: float,
+        version: Optional[str] = None,
+        change_version: Optional[int] = None,
+        check_time: Optional[float] = None,
+    ):
+        self._plans = plans
+        self.generation = generation
+        self.load_time = load_time
+        # The version in the shared cache the snapshot was built from, if any
+        self.version = version
+        # The last entry of the change log included in the snapshot, if known
+        self.change_version = change_version
+        self.check_time = load_time if check_time is None else check_time
+
+    @classmethod
+    def from_rows(
+        cls,
+        rows: Sequence[RolloutRow],
+        generation: int,
+        version: Optional[str] = None,
+        change_version: Optional[int] = None,
+    ) -> "RolloutSnapshot":
+        return cls(
+            compile_plans(rows), generation, time.monotonic(), version, change_version
+        )
+
+    @classmethod
+    def load(cls, generation: int) -> "RolloutSnapshot":
+        from .models import RolloutChange
+
+        change_version = None
+        if get_poll_interval() is not None:
+            # Read the version first: changes made while reading the rows
+            # will be applied again on the next check, which is harmless.
+            change_version = RolloutChange.get_current_version(
+                using=get_read_database()
+            )
+        return cls.from_rows(fetch_rows(), generation, change_version=change_version)
+
+    @classmethod
+    async def aload(cls, generation: int) -> "RolloutSnapshot":
+        from .store import DatabaseStore
+
+        rows = [row async for row in DatabaseStore().get_all_rollouts()]
+        return cls.from_rows(rows, generation)
+
+    def renewed(self, generation: int) -> "RolloutSnapshot":
+        """Return the same snapshot, considered fresh again."""
+        return type(self)(
+            self._plans,
+            generation,
+            time.monotonic(),
+            self.version,
+            self.change_version,
+        )
+
+    def with_changes(
+        self, plans: Dict[str, DecisionPlan], generation: int, change_version: int
+    ) -> "RolloutSnapshot":
+        """Return a copy of the snapshot with the plans of some flags replaced."""
+        return type(self)(
+            {**self._plans, **plans},
+            generation,
+            self.load_time,
+            self.version,
+            change_version,
+            check_time=time.monotonic(),
+        )
+
+    @cached_property
+    def content_version(self) -> str:
+        """
+        A digest of the compiled rollouts.
+
+        It's the same in every process that has loaded the same rollouts,
+        without having to consult the database.
+        """
+        digest = hashlib.sha1()
+        for flag_id in sorted(self._plans):
+            digest.update(repr((flag_id, self._plans[flag_id].shape)).encode())
+        return digest.hexdigest()
+
+    def get_plan(self, flag_id: str) -> DecisionPlan:
+        try:
+            return self._plans[flag_id]
+        except KeyError:
+            return DecisionPlan(flag_id, rules=())
+
+    def is_expired(self, ttl: float) -> bool:
+        return time.monotonic() - self.load_time >= ttl
+
+    def is_stale(
+        self, generation: int, ttl: float, poll_interval: Optional[float] = None
+    ) -> bool:
+        if self.generation != generation or self.is_expired(ttl):
+            return True
+        return (
+            poll_interval is not None
+            and time.monotonic() - self.check_time >= poll_interval
+        )
+
+
+_snapshot: Optional[RolloutSnapshot] = None
+_generation = 0
+_lock = threading.Lock()
+# The snapshot being loaded by `aget_snapshot` in each event loop, along with its generation
+_PendingLoad = Tuple[int, "asyncio.Future[RolloutSnapshot]"]
+_pending_loads: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _PendingLoad]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_ttl() -> float:
+    return getattr(settings, "FLIPPY_SNAPSHOT_TTL", DEFAULT_TTL)
+
+
+def get_poll_interval() -> Optional[float]:
+    return getattr(settings, "FLIPPY_SNAPSHOT_POLL_INTERVAL", None)
+
+
+def get_snapshot() -> RolloutSnapshot:
+    """
+    Return the current snapshot, loading a fresh one if it's missing or stale.
+
+    Readers never see a partially built snapshot: a new one is fully loaded first
+    and only then published by a single reference assignment.
+    """
+    global _snapshot
+    ttl = get_ttl()
+    poll_interval = get_poll_interval()
+    snapshot = _snapshot
+    if snapshot is not None and not snapshot.is_stale(_generation, ttl, poll_interval):
+        return snapshot
+    with _lock:
+        # Another thread could have reloaded the snapshot while we were waiting.
+        snapshot = _snapshot
+        generation = _generation
+        if snapshot is None or snapshot.is_stale(generation, ttl, poll_interval):
+            snapshot = _refresh(generation, previous=snapshot)
+            _snapshot = snapshot
+    return snapshot
+
+
+async def aget_snapshot() -> RolloutSnapshot:
+    """
+    Async version of `get_snapshot`, loading the snapshot with the async ORM.
+
+    Coroutines that find the snapshot stale while it's being reloaded wait for that load
+    rather than starting their own.
+    """
+    snapshot = _snapshot
+    generation = _generation
+    poll_interval = get_poll_interval()
+    if snapshot is not None and not snapshot.is_stale(
+        generation, get_ttl(), poll_interval
+    ):
+        return snapshot
+    # Futures belong to an event loop, so each loop shares its own pending load.
+    loop = asyncio.get_running_loop()
+    pending = _pending_loads.get(loop)
+    if pending is None or pending[0] != generation:
+        future = asyncio.ensure_future(_aload(generation, previous=snapshot))
+        pending = _pending_loads[loop] = (generation, future)
+        future.add_done_callback(lambda _: _forget_pending_load(loop, future))
+    # Don't let a cancelled caller cancel the load the others are waiting for.
+    return await asyncio.shield(pending[1])
+
+
+async def _aload(
+    generation: int, previous: Optional[RolloutSnapshot]
+) -> RolloutSnapshot:
+    global _snapshot
+    if get_shared_cache() is None and get_poll_interval() is None:
+        snapshot = await RolloutSnapshot.aload(generation)
+    else:
+        # Refreshes are rare enough not to bother with async versions of every strategy.
+        snapshot = await sync_to_async(_refresh)(generation, previous=previous)
+    _snapshot = snapshot
+    return snapshot
+
+
+def _forget_pending_load(
+    loop: asyncio.AbstractEventLoop, future: asyncio.Future
+) -> None:
+    pending = _pending_loads.get(loop)
+    if pending is not None and pending[1] is future:
+        del _pending_loads[loop]
+
+
+def fetch_rows() -> Tuple[RolloutRow, ...]:
+    from .store import DatabaseStore
+
+    return tuple(DatabaseStore().get_all_rollouts())
+
+
+def fetch_primary_rows() -> Tuple[RolloutRow, ...]:
+    """
+    Return all rollouts from the database they're written to, bypassing `FLIPPY_READ_DATABASE`.
+
+    Used for what gets published to the shared cache (and exported to snapshot files), as other processes
+    keep using it until the next change, long after a replica has caught up.
+    """
+    from .models import Rollout
+
+    using = router.db_for_write(Rollout)
+    return tuple(Rollout.objects.using(using).for_evaluation())
+
+
+def get_shared_cache() -> Optional[BaseCache]:
+    alias = getattr(settings, "FLIPPY_SNAPSHOT_CACHE", None)
+    return caches[alias] if alias else None
+
+
+def _refresh(generation: int, previous: Optional[RolloutSnapshot]) -> RolloutSnapshot:
+    if (
+        previous is None
+        or previous.change_version is None
+        or previous.is_expired(get_ttl())
+    ):
+        return _load(generation, previous)
+    return _load_changes(generation, previous)
+
+
+def _load_changes(generation: int, previous: RolloutSnapshot) -> RolloutSnapshot:
+    """Reload only the flags which have changed since the previous snapshot."""
+    from .models import RolloutChange
+    from .store import DatabaseStore
+
+    assert previous.change_version is not None
+    # Read the log from the same database as the rollouts, so that they're consistent.
+    using = get_read_database()
+    change_version = RolloutChange.get_current_version(using=using)
+    if change_version == previous.change_version:
+        return previous.with_changes({}, generation, change_version)
+    flag_ids = RolloutChange.get_changed_flag_ids(
+        previous.change_version, change_version, using=using
+    )
+    rows = DatabaseStore().get_rollouts(flag_ids)
+    return previous.with_changes(
+        compile_plans(rows, flag_ids), generation, change_version
+    )
+
+
+def _load(generation: int, previous: Optional[RolloutSnapshot]) -> RolloutSnapshot:
+    cache = get_shared_cache()
+    if cache is not None:
+        try:
+            return _load_from_cache(cache, generation, previous)
+        except Exception:
+            logger.warning(
+                "Could not load rollouts from the cache, using the database instead",
+                exc_info=True,
+            )
+    return RolloutSnapshot.load(generation)
+
+
+def _load_from_cache(
+    cache: BaseCache, generation: int, previous: Optional[RolloutSnapshot]
+) -> RolloutSnapshot:
+    version = cache.get(CACHE_VERSION_KEY)
+    if version is None:
+        # Nothing was published yet (or it was evicted), so let other processes
+        # use what we're about to read. Don't overwrite a version published meanwhile,
+        # as it could be newer than what we've read.
+        rows = fetch_primary_rows()
+        version = uuid.uuid4().hex
+        cache.set(CACHE_ROWS_KEY.format(version=version), rows, CACHE_ROWS_TIMEOUT)
+        if not cache.add(CACHE_VERSION_KEY, version, timeout=None):
+            version = None
+        return RolloutSnapshot.from_rows(rows, generation, version)
+    if previous is not None and previous.version == version:
+        # Nothing has changed since the previous snapshot.
+        return previous.renewed(generation)
+    rows = cache.get(CACHE_ROWS_KEY.format(version=version))
+    if rows is None:
+        return RolloutSnapshot.load(generation)
+    return RolloutSnapshot.from_rows(rows, generation, version)
+
+
+def publish() -> None:
+    """Store the current rollouts in the shared cache as a new version, if one is configured."""
+    cache = get_shared_cache()
+    if cache is None:
+        return
+    try:
+        rows = fetch_primary_rows()
+        version = uuid.uuid4().hex
+        cache.set(CACHE_ROWS_KEY.format(version=version), rows, CACHE_ROWS_TIMEOUT)
+        cache.set(CACHE_VERSION_KEY, version, timeout=None)
+    except Exception:
+        # Other processes will still pick up the change from the database after their TTL.
+        logger.warning("Could not publish rollouts to the cache", exc_info=True)
+
+
+def invalidate() -> None:
+    """
+    Mark the current snapshot as stale.
+
+    A snapshot that's being loaded concurrently will be considered stale as well,
+    since it could have been read before the change.
+    """
+    global _generation
+    _generation += 1
+
+
+def on_rollout_changed(
+    sender, instance: "Rollout", using: Optional[str] = None, **kwargs
+) -> None:
+    from django.db import transaction
+    from .models import RolloutChange
+
+    RolloutChange.record(instance.get_changed_flag_ids(), using=using)
+    invalidate()
+    # Readers in other threads could reload the snapshot before the transaction
+    # that changed the rollout is committed. Invalidate once more when it is.
+    transaction.on_commit(_on_rollout_change_committed, using=using)
+
+
+def _on_rollout_change_committed() -> None:
+    publish()
+    invalidate()
+
+
+def reset() -> None:
+    """Drop the current snapshot, so that the next one is loaded from scratch."""
+    global _snapshot
+    _snapshot = None
+    invalidate()
+
+
+def on_setting_changed(setting: str, **kwargs) -> None:
+    if setting.startswith("FLIPPY_"):
+        reset()
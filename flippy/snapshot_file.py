@@ -0,0 +1,163 @@
+"""
+Rollout snapshot files, written by `manage.py flippy_export_snapshot` and read by `flippy.store.FileStore`.
+
+The file starts with a JSON header line, which holds the location of each flag's rollouts
+(relative to the end of the header):
+
+    {"format": "flippy-snapshot", "format_version": 1, "version": "...", "flags": {"chat": [offset, length], ...}}
+    [["flippy.subject.UserSubject", 50.0], ...]
+    ...
+
+Readers memory-map the file and only parse the rollouts of the flags they're asked about.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import secrets
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .evaluation import DecisionPlan, RolloutRow, RolloutValues
+from .exceptions import ConfigurationError
+
+FORMAT = "flippy-snapshot"
+FORMAT_VERSION = 1
+
+
+def write_snapshot_file(path: str, rows: Iterable[RolloutRow]) -> str:
+    """
+    Write the rollouts (ordered from the newest) to a snapshot file, returning its version.
+
+    The file is replaced atomically, so readers never see it partially written.
+    """
+    rollouts_by_flag: Dict[str, List[RolloutValues]] = {}
+    for flag_id, subject_path, enable_percentage in rows:
+        rollouts_by_flag.setdefault(flag_id, []).append(
+            (subject_path, enable_percentage)
+        )
+    sections = [
+        (flag_id, json.dumps(rollouts, separators=(",", ":")).encode() + b"\n")
+        for flag_id, rollouts in sorted(rollouts_by_flag.items())
+    ]
+    body = b"".join(section for _, section in sections)
+    version = hashlib.sha1(body).hexdigest()
+
+    flags = {}
+    offset = 0
+    for flag_id, section in sections:
+        flags[flag_id] = [offset, len(section)]
+        offset += len(section)
+    header = {
+        "format": FORMAT,
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "flags": flags,
+    }
+
+    directory = os.path.dirname(os.path.abspath(path))
+    temp_path = os.path.join(directory, f".flippy-snapshot-{secrets.token_hex(8)}")
+    # Unlike mkstemp(), which makes the file readable by its owner only, let the umask decide,
+    # as web workers may run as another user than the one exporting the snapshot.
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        try:
+            f = os.fdopen(fd, "wb")
+        except BaseException:
+            os.close(fd)
+            raise
+        with f:
+            f.write(json.dumps(header, separators=(",", ":")).encode() + b"\n")
+            f.write(body)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return version
+
+
+class SnapshotFile:
+    """A memory-mapped snapshot file. The rollouts of each flag are parsed on first use."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        header = json.loads(self._mmap.readline())
+        if (
+            header.get("format") != FORMAT
+            or header.get("format_version") != FORMAT_VERSION
+        ):
+            raise ConfigurationError(f"{path} is not a supported snapshot file")
+        self.version: str = header["version"]
+        body_start = self._mmap.tell()
+        self._locations: Dict[str, Tuple[int, int]] = {
+            flag_id: (body_start + offset, length)
+            for flag_id, (offset, length) in header["flags"].items()
+        }
+        self._plans: Dict[str, DecisionPlan] = {}
+
+    @property
+    def flag_ids(self) -> Iterable[str]:
+        return self._locations.keys()
+
+    def get_rollouts(self, flag_id: str) -> List[RolloutValues]:
+        location = self._locations.get(flag_id)
+        if location is None:
+            return []
+        offset, length = location
+        rollouts = json.loads(self._mmap[offset : offset + length])
+        return [(subject_path, percentage) for subject_path, percentage in rollouts]
+
+    def get_plan(self, flag_id: str) -> DecisionPlan:
+        try:
+            return self._plans[flag_id]
+        except KeyError:
+            plan = self._plans[flag_id] = DecisionPlan.compile(
+                flag_id, self.get_rollouts(flag_id)
+            )
+            return plan
+
+
+class SnapshotFileReader:
+    """
+    Provides the current contents of a snapshot file.
+
+    The file is re-read when its modification time changes, checked at most every `check_interval` seconds.
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._file: Optional[SnapshotFile] = None
+        self._check_time = 0.0
+        self._lock = threading.Lock()
+
+    def get_file(self) -> SnapshotFile:
+        snapshot_file = self._file
+        now = time.monotonic()
+        if snapshot_file is not None and now - self._check_time < self.check_interval:
+            return snapshot_file
+        with self._lock:
+            snapshot_file = self._file
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError as e:
+                raise ConfigurationError(
+                    f"Snapshot file {self.path} doesn't exist. "
+                    f"Create it with `manage.py flippy_export_snapshot`."
+                ) from e
+            if (
+                snapshot_file is None
+                or snapshot_file.mtime_ns != stat.st_mtime_ns
+                or snapshot_file.size != stat.st_size
+            ):
+                # Swap in the new file only once it's fully read.
+                snapshot_file = self._file = SnapshotFile(self.path)
+            self._check_time = now
+        return snapshot_file
@@ -0,0 +1,118 @@
+import os
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+
+from .exceptions import ConfigurationError
+from .flag import Flag
+from .models import Rollout
+from .snapshot_file import SnapshotFile, SnapshotFileReader, write_snapshot_file
+from .store import FileStore, get_store
+from .test_utils import request_factory
+
+ROWS = [
+    ("hello", "flippy.subject.UserSubject", 50.0),
+    ("hello", "flippy.subject.IpAddressSubject", 100.0),
+    ("other", "flippy.subject.UserSubject", 100.0),
+]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "snapshot")
+
+
+def test_snapshot_file_round_trip(path):
+    version = write_snapshot_file(path, ROWS)
+    snapshot_file = SnapshotFile(path)
+    assert snapshot_file.version == version
+    assert sorted(snapshot_file.flag_ids) == ["hello", "other"]
+    assert snapshot_file.get_rollouts("hello") == [
+        ("flippy.subject.UserSubject", 50.0),
+        ("flippy.subject.IpAddressSubject", 100.0),
+    ]
+    assert snapshot_file.get_rollouts("missing") == []
+    assert snapshot_file.get_plan("other").shape == (
+        ("flippy.subject.UserSubject", 100.0),
+    )
+
+
+def test_snapshot_file_is_readable_by_others(path):
+    umask = os.umask(0o022)
+    try:
+        write_snapshot_file(path, ROWS)
+    finally:
+        os.umask(umask)
+    assert os.stat(path).st_mode & 0o777 == 0o644
+
+
+def test_snapshot_file_version_depends_on_contents(path):
+    assert write_snapshot_file(path, ROWS) == write_snapshot_file(path, ROWS)
+    assert write_snapshot_file(path, ROWS) != write_snapshot_file(path, ROWS[1:])
+
+
+def test_snapshot_file_is_reloaded_when_replaced(path):
+    write_snapshot_file(path, ROWS)
+    reader = SnapshotFileReader(path, check_interval=0)
+    first = reader.get_file()
+    assert reader.get_file() is first
+    write_snapshot_file(path, ROWS[:1])
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, first.mtime_ns + 1))
+    assert reader.get_file().get_rollouts("other") == []
+
+
+def test_snapshot_file_is_checked_at_most_every_interval(path):
+    write_snapshot_file(path, ROWS)
+    reader = SnapshotFileReader(path, check_interval=60)
+    first = reader.get_file()
+    os.unlink(path)
+    assert reader.get_file() is first
+
+
+def test_missing_snapshot_file(path):
+    with pytest.raises(ConfigurationError):
+        SnapshotFileReader(path).get_file()
+
+
+@pytest.fixture
+def file_store(settings, path):
+    write_snapshot_file(path, ROWS)
+    settings.FLIPPY_STORE = "flippy.store.FileStore"
+    settings.FLIPPY_SNAPSHOT_FILE = path
+    return get_store()
+
+
+def test_file_store_requires_path(settings):
+    settings.FLIPPY_STORE = "flippy.store.FileStore"
+    with pytest.raises(ConfigurationError):
+        get_store()
+
+
+@pytest.mark.django_db
+def test_flags_use_file_store(file_store, django_assert_num_queries):
+    assert isinstance(file_store, FileStore)
+    with django_assert_num_queries(0):
+        assert Flag("hello").get_state_for_request(request_factory()) is True
+        assert Flag("missing").get_state_for_request(request_factory()) is False
+        assert (
+            async_to_sync(Flag("other").aget_state_for_request)(request_factory())
+            is False
+        )
+
+
+def test_file_store_rollouts(file_store):
+    assert sorted(file_store.get_all_rollouts()) == sorted(ROWS)
+    assert file_store.get_rollouts(["other"]) == [ROWS[2]]
+    assert file_store.get_version() == SnapshotFile(file_store.reader.path).version
+
+
+@pytest.mark.django_db
+def test_export_snapshot_command(path, settings):
+    Rollout.objects.create(flag_id="hello", subject="flippy.subject.IpAddressSubject")
+    settings.FLIPPY_SNAPSHOT_FILE = path
+    call_command("flippy_export_snapshot", stdout=open(os.devnull, "w"))
+    assert SnapshotFile(path).get_rollouts("hello") == [
+        ("flippy.subject.IpAddressSubject", 100)
+    ]
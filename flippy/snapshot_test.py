@@ -0,0 +1,252 @@
+import asyncio
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+from . import snapshot
+from .flag import Flag
+from .models import Rollout, RolloutChange
+from .test_utils import request_factory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def snapshot_enabled(settings):
+    settings.FLIPPY_SNAPSHOT = True
+    settings.FLIPPY_SNAPSHOT_TTL = 60
+    yield
+    snapshot.reset()
+
+
+def test_snapshot_groups_rollouts_by_flag():
+    Rollout.objects.create(flag_id="hello", subject="flippy.subject.IpAddressSubject")
+    Rollout.objects.create(
+        flag_id="hello", subject="flippy.subject.UserSubject", enable_percentage=50
+    )
+    Rollout.objects.create(flag_id="other", subject="flippy.subject.UserSubject")
+    result = snapshot.RolloutSnapshot.load(generation=0)
+    assert result.get_plan("hello").shape == (
+        ("flippy.subject.UserSubject", 50),
+        ("flippy.subject.IpAddressSubject", 100),
+    )
+    assert result.get_plan("other").shape == (("flippy.subject.UserSubject", 100),)
+    assert result.get_plan("missing").is_constant
+
+
+def test_flag_with_snapshot_doesnt_query(snapshot_enabled, django_assert_num_queries):
+    f = Flag("hello")
+    Rollout.objects.create(flag_id=f.id, subject="flippy.subject.IpAddressSubject")
+    with django_assert_num_queries(1):
+        assert f.get_state_for_request(request_factory()) is True
+        assert f.get_state_for_request(request_factory()) is True
+        assert Flag("other").get_state_for_request(request_factory()) is False
+
+
+def test_snapshot_is_reloaded_on_save(snapshot_enabled):
+    f = Flag("hello")
+    Rollout.objects.create(flag_id=f.id, subject="flippy.subject.IpAddressSubject")
+    assert f.get_state_for_request(request_factory()) is True
+    Rollout.objects.create(
+        flag_id=f.id, subject="flippy.subject.IpAddressSubject", enable_percentage=0
+    )
+    assert f.get_state_for_request(request_factory()) is False
+
+
+def test_snapshot_is_reloaded_on_delete(snapshot_enabled):
+    f = Flag("hello")
+    rollout = Rollout.objects.create(
+        flag_id=f.id, subject="flippy.subject.IpAddressSubject"
+    )
+    assert f.get_state_for_request(request_factory()) is True
+    rollout.delete()
+    assert f.get_state_for_request(request_factory()) is False
+
+
+def test_snapshot_is_reloaded_after_ttl(snapshot_enabled, settings):
+    f = Flag("hello")
+    assert f.get_state_for_request(request_factory()) is False
+    # Bypass the signals, as if the change was made by another process.
+    Rollout.objects.bulk_create(
+        [Rollout(flag_id=f.id, subject="flippy.subject.IpAddressSubject")]
+    )
+    assert f.get_state_for_request(request_factory()) is False
+    settings.FLIPPY_SNAPSHOT_TTL = 0
+    assert f.get_state_for_request(request_factory()) is True
+
+
+def test_snapshot_loaded_during_invalidation_is_stale():
+    loaded = snapshot.RolloutSnapshot.load(generation=snapshot._generation)
+    snapshot.invalidate()
+    assert loaded.is_stale(snapshot._generation, ttl=60)
+
+
+def test_async_flag_uses_snapshot(snapshot_enabled, django_assert_num_queries):
+    f = Flag("hello")
+    Rollout.objects.create(flag_id=f.id, subject="flippy.subject.IpAddressSubject")
+    with django_assert_num_queries(1):
+        assert async_to_sync(f.aget_state_for_request)(request_factory()) is True
+        assert async_to_sync(f.aget_state_for_request)(request_factory()) is True
+
+
+def test_concurrent_async_reloads_share_one_load(snapshot_enabled, monkeypatch):
+    loads = []
+    original_aload = snapshot.RolloutSnapshot.aload
+
+    async def counting_aload(generation):
+        loads.append(generation)
+        return await original_aload(generation)
+
+    monkeypatch.setattr(snapshot.RolloutSnapshot, "aload", counting_aload)
+
+    async def check_concurrently():
+        return await asyncio.gather(*(snapshot.aget_snapshot() for _ in range(10)))
+
+    snapshots = async_to_sync(check_concurrently)()
+    assert len(loads) == 1
+    assert all(loaded is snapshots[0] for loaded in snapshots)
+
+
+class BrokenCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+
+    def get(self, key, default=None, version=None):
+        raise ConnectionError("cache is down")
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        raise ConnectionError("cache is down")
+
+
+@pytest.fixture
+def shared_cache(snapshot_enabled, settings):
+    settings.FLIPPY_SNAPSHOT_CACHE = "default"
+    cache = caches["default"]
+    cache.clear()
+    yield cache
+    cache.clear()
+
+
+def test_snapshot_is_published_to_cache_on_commit(
+    shared_cache, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        Rollout.objects.create(
+            flag_id="hello", subject="flippy.subject.IpAddressSubject"
+        )
+    version = shared_cache.get(snapshot.CACHE_VERSION_KEY)
+    rows = shared_cache.get(snapshot.CACHE_ROWS_KEY.format(version=version))
+    assert rows == (("hello", "flippy.subject.IpAddressSubject", 100),)
+
+
+def test_snapshot_is_loaded_from_cache(shared_cache, django_assert_num_queries):
+    f = Flag("hello")
+    shared_cache.set(snapshot.CACHE_VERSION_KEY, "v1")
+    shared_cache.set(
+        snapshot.CACHE_ROWS_KEY.format(version="v1"),
+        (("hello", "flippy.subject.IpAddressSubject", 100),),
+    )
+    with django_assert_num_queries(0):
+        assert f.get_state_for_request(request_factory()) is True
+    assert snapshot.get_snapshot().version == "v1"
+
+
+def test_unchanged_snapshot_is_reused(shared_cache, settings):
+    shared_cache.set(snapshot.CACHE_VERSION_KEY, "v1")
+    shared_cache.set(snapshot.CACHE_ROWS_KEY.format(version="v1"), ())
+    previous = snapshot.get_snapshot()
+    shared_cache.delete(snapshot.CACHE_ROWS_KEY.format(version="v1"))
+    renewed = snapshot._load(snapshot._generation, previous)
+    assert renewed.version == "v1"
+    assert renewed._plans is previous._plans
+
+
+def test_snapshot_is_seeded_to_empty_cache(shared_cache):
+    Rollout.objects.create(flag_id="hello", subject="flippy.subject.IpAddressSubject")
+    loaded = snapshot.get_snapshot()
+    assert loaded.version == shared_cache.get(snapshot.CACHE_VERSION_KEY)
+    assert shared_cache.get(snapshot.CACHE_ROWS_KEY.format(version=loaded.version))
+
+
+def test_snapshot_falls_back_to_database_when_cache_fails(snapshot_enabled, settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "broken": {"BACKEND": "flippy.snapshot_test.BrokenCache"},
+    }
+    settings.FLIPPY_SNAPSHOT_CACHE = "broken"
+    f = Flag("hello")
+    Rollout.objects.create(flag_id=f.id, subject="flippy.subject.IpAddressSubject")
+    assert f.get_state_for_request(request_factory()) is True
+
+
+@pytest.fixture
+def polling_enabled(snapshot_enabled, settings):
+    settings.FLIPPY_SNAPSHOT_POLL_INTERVAL = 0
+
+
+def test_rollout_changes_are_logged():
+    rollout = Rollout.objects.create(
+        flag_id="hello", subject="flippy.subject.IpAddressSubject"
+    )
+    rollout = Rollout.objects.get(pk=rollout.pk)
+    rollout.flag_id = "hello2"
+    rollout.save()
+    rollout.delete()
+    changes = RolloutChange.objects.order_by("id").values_list("flag_id", flat=True)
+    assert sorted(changes) == ["hello", "hello", "hello2", "hello2"]
+
+
+def test_rollout_changes_are_versioned_per_write():
+    start = RolloutChange.get_current_version()
+    RolloutChange.record(["hello", "other"])
+    RolloutChange.record(["hello"])
+    versions = RolloutChange.objects.order_by("id").values_list("flag_id", "version")
+    assert list(versions) == [
+        ("hello", start + 1),
+        ("other", start + 1),
+        ("hello", start + 2),
+    ]
+    assert RolloutChange.get_changed_flag_ids(start + 1, start + 2) == {"hello"}
+
+
+def test_snapshot_polls_for_changes(polling_enabled, django_assert_num_queries):
+    f = Flag("hello")
+    assert f.get_state_for_request(request_factory()) is False
+    # Bypass the signals, as if the change was made by another process.
+    Rollout.objects.bulk_create(
+        [Rollout(flag_id=f.id, subject="flippy.subject.IpAddressSubject")]
+    )
+    RolloutChange.record([f.id])
+    with django_assert_num_queries(3):
+        # The version, the changed flags and their rollouts
+        assert f.get_state_for_request(request_factory()) is True
+    with django_assert_num_queries(1):
+        # Only the version
+        assert f.get_state_for_request(request_factory()) is True
+
+
+def test_snapshot_applies_only_changed_flags(polling_enabled):
+    Rollout.objects.create(flag_id="hello", subject="flippy.subject.IpAddressSubject")
+    Rollout.objects.create(flag_id="other", subject="flippy.subject.IpAddressSubject")
+    before = snapshot.get_snapshot()
+    Rollout.objects.create(
+        flag_id="hello", subject="flippy.subject.UserSubject", enable_percentage=0
+    )
+    after = snapshot.get_snapshot()
+    assert after.get_plan("other") is before.get_plan("other")
+    assert after.get_plan("hello").shape == (
+        ("flippy.subject.UserSubject", 0),
+        ("flippy.subject.IpAddressSubject", 100),
+    )
+
+
+def test_snapshot_with_polling_is_reloaded_on_delete(polling_enabled):
+    f = Flag("hello")
+    rollout = Rollout.objects.create(
+        flag_id=f.id, subject="flippy.subject.IpAddressSubject"
+    )
+    assert f.get_state_for_request(request_factory()) is True
+    rollout.delete()
+    assert f.get_state_for_request(request_factory()) is False
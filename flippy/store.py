@@ -0,0 +1,215 @@
+"""
+Storage backends that flags read their rollouts from.
+
+The backend is selected with the `FLIPPY_STORE` setting, a dotted path to a `RolloutStore` subclass.
+By default, rollouts are read from the database (or from the in-memory snapshot, if `FLIPPY_SNAPSHOT = True`).
+"""
+
+from abc import ABC, abstractmethod
+from typing import Collection, Dict, Hashable, Iterable, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils.module_loading import import_string
+
+from .evaluation import DecisionPlan, RolloutRow, compile_plans
+from .exceptions import ConfigurationError
+from .routing import get_read_database
+
+
+class RolloutStore(ABC):
+    @abstractmethod
+    def get_rollouts(self, flag_ids: Collection[str]) -> Iterable[RolloutRow]:
+        """Return the rollouts of the given flags, starting from the newest."""
+        ...
+
+    @abstractmethod
+    def get_all_rollouts(self) -> Iterable[RolloutRow]:
+        """Return the rollouts of all flags, starting from the newest."""
+        ...
+
+    @abstractmethod
+    def get_version(self) -> Hashable:
+        """Return a value that changes whenever the rollouts change."""
+        ...
+
+    async def aget_version(self) -> Hashable:
+        """Async version of `get_version`."""
+        return await sync_to_async(self.get_version)()
+
+    def get_plans(self, flag_ids: Collection[str]) -> Dict[str, DecisionPlan]:
+        """Return the compiled rollouts of each of the given flags."""
+        return compile_plans(self.get_rollouts(flag_ids), flag_ids)
+
+    async def aget_plans(self, flag_ids: Collection[str]) -> Dict[str, DecisionPlan]:
+        """Async version of `get_plans`."""
+        return await sync_to_async(self.get_plans)(flag_ids)
+
+
+class DatabaseStore(RolloutStore):
+    """
+    Reads the rollouts from the `Rollout` model on each call.
+
+    The reads go to the `FLIPPY_READ_DATABASE`, if set (see `flippy.routing`).
+    """
+
+    def get_rollouts(self, flag_ids: Collection[str]) -> QuerySet:
+        """Return the rollouts as a queryset of rows, which can also be iterated with `async for`."""
+        from .models import Rollout
+
+        rollouts = Rollout.objects.using(get_read_database())
+        return rollouts.filter(flag_id__in=flag_ids).for_evaluation()
+
+    def get_all_rollouts(self) -> QuerySet:
+        from .models import Rollout
+
+        return Rollout.objects.using(get_read_database()).for_evaluation()
+
+    def get_version(self) -> Hashable:
+        from .models import RolloutChange
+
+        return RolloutChange.get_current_version(using=get_read_database())
+
+    async def aget_plans(self, flag_ids: Collection[str]) -> Dict[str, DecisionPlan]:
+        rows = [row async for row in self.get_rollouts(flag_ids)]
+        return compile_plans(rows, flag_ids)
+
+
+class CachedStore(RolloutStore):
+    """
+    Reads the rollouts through the process-local snapshot of the database.
+
+    See `flippy.snapshot` for how the snapshot is kept up to date.
+    """
+
+    def get_rollouts(self, flag_ids: Collection[str]) -> Iterable[RolloutRow]:
+        return DatabaseStore().get_rollouts(flag_ids)
+
+    def get_all_rollouts(self) -> Iterable[RolloutRow]:
+        return DatabaseStore().get_all_rollouts()
+
+    def get_version(self) -> Hashable:
+        from . import snapshot
+
+        return snapshot.get_snapshot().content_version
+
+    def get_plans(self, flag_ids: Collection[str]) -> Dict[str, DecisionPlan]:
+        from . import snapshot
+
+        current_snapshot = snapshot.get_snapshot()
+        return {flag_id: current_snapshot.get_plan(flag_id) for flag_id in flag_ids}
+
+    async def aget_plans(self, flag_ids: Collection[str]) -> Dict[str, DecisionPlan]:
+        from . import snapshot
+
+        current_snapshot = await snapshot.aget_snapshot()
+        return {flag_id: current_snapshot.get_plan(flag_id) for flag_id in flag_ids}
+
+
+class InMemoryStore(RolloutStore):
+    """Keeps the rollouts in a list, without touching the database. Useful for tests and benchmarks."""
+
+    def __init__(self) -> None:
+        self._rows: List[RolloutRow] = []
+        self._version = 0
+
+    def add(self, flag_id: str, subject: str, enable_percentage: float = 100) -> None:
+        """Add a rollout, newer than all the existing ones."""
+        self._rows.insert(0, (flag_id, subject, enable_percentage))
+        self._version += 1
+
+    def clear(self) -> None:
+        self._rows = []
+        self._version += 1
+
+    def get_rollouts(self, flag_ids: Collection[str]) -> Iterable[RolloutRow]:
+        flag_ids = set(flag_ids)
+        return [row for row in self._rows if row[0] in flag_ids]
+
+    def get_all_rollouts(self) -> Iterable[RolloutRow]:
+        return list(self._rows)
+
+    def get_version(self) -> Hashable:
+        return self._version
+
+    async def aget_plans(self, flag_ids: Collection[str]) -> Dict[str, DecisionPlan]:
+        return self.get_plans(flag_ids)
+
+
+class FileStore(RolloutStore):
+    """
+    Reads the rollouts from the snapshot file at `FLIPPY_SNAPSHOT_FILE`, without touching the database.
+
+    The file is written by `manage.py flippy_export_snapshot`, and re-read when it's replaced.
+    See `flippy.snapshot_file` for the format.
+    """
+
+    def __init__(self) -> None:
+        from .snapshot_file import SnapshotFileReader
+
+        path = getattr(settings, "FLIPPY_SNAPSHOT_FILE", None)
+        if path is None:
+            raise ConfigurationError(
+                "FileStore requires the FLIPPY_SNAPSHOT_FILE setting"
+            )
+        check_interval = getattr(settings, "FLIPPY_SNAPSHOT_FILE_CHECK_INTERVAL", 1.0)
+        self.reader = SnapshotFileReader(path, check_interval=check_interval)
+
+    def get_rollouts(self, flag_ids: Collection[str]) -> Iterable[RolloutRow]:
+        snapshot_file = self.reader.get_file()
+        return [
+            (flag_id, subject_path, enable_percentage)
+            for flag_id in flag_ids
+            for subject_path, enable_percentage in snapshot_file.get_rollouts(flag_id)
+        ]
+
+    def get_all_rollouts(self) -> Iterable[RolloutRow]:
+        return self.get_rollouts(list(self.reader.get_file().flag_ids))
+
+    def get_version(self) -> Hashable:
+        return self.reader.get_file().version
+
+    def get_plans(self, flag_ids: Collection[str]) -> Dict[str, DecisionPlan]:
+        snapshot_file = self.reader.get_file()
+        return {flag_id: snapshot_file.get_plan(flag_id) for flag_id in flag_ids}
+
+    async def aget_plans(self, flag_ids: Collection[str]) -> Dict[str, DecisionPlan]:
+        return self.get_plans(flag_ids)
+
+
+_store: Optional[RolloutStore] = None
+
+
+def get_store() -> RolloutStore:
+    """Return the configured store. The instance is shared until the settings change."""
+    global _store
+    store = _store
+    if store is None:
+        store = _store = _create_store()
+    return store
+
+
+def _create_store() -> RolloutStore:
+    path = getattr(settings, "FLIPPY_STORE", None)
+    if path is None:
+        snapshot_enabled = getattr(settings, "FLIPPY_SNAPSHOT", False)
+        return CachedStore() if snapshot_enabled else DatabaseStore()
+    try:
+        cls = import_string(path)
+    except ImportError as e:
+        raise ConfigurationError(str(e)) from e
+    if not (isinstance(cls, type) and issubclass(cls, RolloutStore)):
+        raise ConfigurationError(f"{cls} should be a subclass of RolloutStore")
+    return cls()
+
+
+def on_setting_changed(setting: str, **kwargs) -> None:
+    global _store
+    if setting in (
+        "FLIPPY_STORE",
+        "FLIPPY_SNAPSHOT",
+        "FLIPPY_SNAPSHOT_FILE",
+        "FLIPPY_SNAPSHOT_FILE_CHECK_INTERVAL",
+    ):
+        _store = None
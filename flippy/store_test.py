@@ -0,0 +1,78 @@
+import pytest
+
+from . import snapshot
+from .exceptions import ConfigurationError
+from .flag import Flag, evaluate_all
+from .models import Rollout
+from .store import CachedStore, DatabaseStore, InMemoryStore, get_store
+from .test_utils import request_factory
+
+pytestmark = pytest.mark.django_db
+
+
+def test_database_store_is_the_default():
+    assert isinstance(get_store(), DatabaseStore)
+
+
+def test_snapshot_setting_selects_cached_store(settings):
+    settings.FLIPPY_SNAPSHOT = True
+    assert isinstance(get_store(), CachedStore)
+
+
+def test_store_is_shared_until_settings_change(settings):
+    settings.FLIPPY_STORE = "flippy.store.InMemoryStore"
+    store = get_store()
+    assert isinstance(store, InMemoryStore)
+    assert get_store() is store
+    settings.FLIPPY_STORE = "flippy.store.DatabaseStore"
+    assert isinstance(get_store(), DatabaseStore)
+
+
+@pytest.mark.parametrize(
+    "path", ["flippy.store.DoesNotExist", "flippy.subject.UserSubject"]
+)
+def test_invalid_store_setting(settings, path):
+    settings.FLIPPY_STORE = path
+    with pytest.raises(ConfigurationError):
+        get_store()
+
+
+def test_flags_use_in_memory_store(settings, django_assert_num_queries):
+    settings.FLIPPY_STORE = "flippy.store.InMemoryStore"
+    store = get_store()
+    f = Flag("hello")
+    store.add(f.id, "flippy.subject.IpAddressSubject", 0)
+    store.add(f.id, "flippy.subject.UserSubject", 100)
+    with django_assert_num_queries(0):
+        assert f.get_state_for_request(request_factory()) is False
+        assert evaluate_all(request_factory(), [f.id]) == {f.id: False}
+
+
+def test_in_memory_store_version_changes():
+    store = InMemoryStore()
+    version = store.get_version()
+    store.add("hello", "flippy.subject.IpAddressSubject")
+    assert store.get_version() != version
+
+
+@pytest.mark.parametrize("store_class", [DatabaseStore, CachedStore])
+def test_database_backed_stores(store_class):
+    Rollout.objects.create(flag_id="hello", subject="flippy.subject.IpAddressSubject")
+    Rollout.objects.create(flag_id="other", subject="flippy.subject.UserSubject")
+    store = store_class()
+    assert list(store.get_rollouts(["hello"])) == [
+        ("hello", "flippy.subject.IpAddressSubject", 100)
+    ]
+    assert len(list(store.get_all_rollouts())) == 2
+    assert store.get_plans(["hello"])["hello"].shape == (
+        ("flippy.subject.IpAddressSubject", 100),
+    )
+    snapshot.reset()
+
+
+def test_cached_store_version_depends_on_content():
+    store = CachedStore()
+    version = store.get_version()
+    Rollout.objects.create(flag_id="hello", subject="flippy.subject.IpAddressSubject")
+    assert store.get_version() != version
+    snapshot.reset()
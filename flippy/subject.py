@@ -1,8 +1,20 @@
 import hashlib
 import importlib
+from functools import lru_cache
 from abc import ABC, abstractmethod
-from typing import Optional, Sequence, Generic, Type, TypeVar, TYPE_CHECKING
-
+from typing import (
+    Any,
+    Dict,
+    Optional,
+    Sequence,
+    Generic,
+    Tuple,
+    Type,
+    TypeVar,
+    TYPE_CHECKING,
+)
+
+from asgiref.sync import sync_to_async
 from dataclasses import dataclass
 from django.http import HttpRequest
 
@@ -24,38 +36,61 @@ class SubjectIdentifier:
 
         Deterministic.
         """
-        m = hashlib.sha256()
-        assert m.digest_size == 32
-        delimiter = b"\0\0\0\0Cookies!\3\2\1\0"
-        m.update(self.subject_class.encode())
-        m.update(delimiter)
-        m.update(self.subject_id.encode())
-        m.update(delimiter)
-        m.update(flag_id.encode())
-        digest = m.digest()
-        step = 4
-        word = 0
-        for i in range(0, m.digest_size, step):
-            digest_part = digest[i : i + step]
-            word ^= int.from_bytes(digest_part, "little")
-        fraction = word / (1 << (8 * step))
-        assert 0 <= fraction < 1
-        return fraction
+        return _get_flag_score(self.subject_class, self.subject_id, flag_id)
+
+
+_SCORE_DELIMITER = b"\0\0\0\0Cookies!\3\2\1\0"
+_SCORE_CACHE_SIZE = 4096
+
+# sha256 states after hashing `subject_class + delimiter`, by subject class
+_score_prefixes: Dict[str, "hashlib._Hash"] = {}
+
+
+@lru_cache(maxsize=_SCORE_CACHE_SIZE)
+def _get_flag_score(subject_class: str, subject_id: str, flag_id: str) -> float:
+    try:
+        prefix = _score_prefixes[subject_class]
+    except KeyError:
+        prefix = hashlib.sha256()
+        prefix.update(subject_class.encode())
+        prefix.update(_SCORE_DELIMITER)
+        _score_prefixes[subject_class] = prefix
+    m = prefix.copy()
+    m.update(subject_id.encode())
+    m.update(_SCORE_DELIMITER)
+    m.update(flag_id.encode())
+    # XOR-fold the 256-bit digest into a 32-bit word:
+    # the digest is read as eight little-endian 32-bit words, which get XORed together.
+    word = int.from_bytes(m.digest(), "little")
+    word ^= word >> 128
+    word ^= word >> 64
+    word ^= word >> 32
+    fraction = (word & 0xFFFFFFFF) / (1 << 32)
+    assert 0 <= fraction < 1
+    return fraction
 
 
 class Subject(ABC):
+    #: Set to True if the subject provides an identifier for every request and object.
+    #: Rollouts older than a rollout of such a subject can never apply, so they're skipped.
+    always_matches: bool = False
+
     @abstractmethod
     def get_identifier_for_request(self, request: HttpRequest) -> Optional[str]:
         ...
 
+    async def aget_identifier_for_request(self, request: HttpRequest) -> Optional[str]:
+        """
+        Async version of `get_identifier_for_request`, used by async flag evaluation.
+
+        By default it runs `get_identifier_for_request` in a thread, as it may touch the database.
+        Override it if the identifier can be determined without blocking.
+        """
+        return await sync_to_async(self.get_identifier_for_request)(request)
+
     @classmethod
     def get_installed_subjects(cls) -> Sequence["Subject"]:
-        from django.conf import settings
-
-        results = []
-        for path in settings.FLIPPY_SUBJECTS:
-            results.append(import_and_instantiate_subject(path))
-        return results
+        return subject_registry.get_installed()
 
     @property
     def subject_class(self) -> str:
@@ -71,6 +106,10 @@ class TypedSubject(Subject, Generic[T]):
     def get_identifier_for_object(self, obj: T) -> Optional[str]:
         ...
 
+    async def aget_identifier_for_object(self, obj: T) -> Optional[str]:
+        """Async version of `get_identifier_for_object`. See `aget_identifier_for_request`."""
+        return await sync_to_async(self.get_identifier_for_object)(obj)
+
     @abstractmethod
     def is_supported_type(self, type: type) -> bool:
         # TODO is it possible to make a generic implementation?
@@ -90,6 +129,77 @@ def import_and_instantiate_subject(path: str) -> Subject:
         raise ConfigurationError(str(e)) from e
 
 
+class SubjectRegistry:
+    """
+    Resolves subjects by their dotted paths.
+
+    Each path is imported and instantiated only once; the instances are shared.
+    """
+
+    def __init__(self) -> None:
+        self._subjects: Dict[str, Subject] = {}
+        self._installed: Optional[Tuple[Subject, ...]] = None
+
+    def get(self, path: str) -> Subject:
+        try:
+            return self._subjects[path]
+        except KeyError:
+            subject = self._subjects[path] = import_and_instantiate_subject(path)
+            return subject
+
+    def get_installed(self) -> Sequence[Subject]:
+        """Return the subjects listed in `settings.FLIPPY_SUBJECTS`."""
+        from django.conf import settings
+
+        installed = self._installed
+        if installed is None:
+            installed = self._installed = tuple(
+                self.get(path) for path in settings.FLIPPY_SUBJECTS
+            )
+        return installed
+
+    def reset(self) -> None:
+        """Forget all resolved subjects, e.g. after `settings.FLIPPY_SUBJECTS` changes."""
+        self._subjects = {}
+        self._installed = None
+
+
+subject_registry = SubjectRegistry()
+
+
+def on_setting_changed(setting: str, **kwargs) -> None:
+    if setting == "FLIPPY_SUBJECTS":
+        subject_registry.reset()
+
+
+def build_identifier(subject: Subject, obj: Any) -> Optional[SubjectIdentifier]:
+    """
+    Identify a request or a typed object as an instance of a subject.
+
+    Returns None in case the subject doesn't match the object.
+    """
+    if isinstance(obj, HttpRequest):
+        subject_id = subject.get_identifier_for_request(obj)
+    else:
+        assert isinstance(subject, TypedSubject)  # TODO handle this gracefully
+        subject_id = subject.get_identifier_for_object(obj)
+    if subject_id is None:
+        return None
+    return SubjectIdentifier(subject.subject_class, subject_id)
+
+
+async def abuild_identifier(subject: Subject, obj: Any) -> Optional[SubjectIdentifier]:
+    """Async version of `build_identifier`."""
+    if isinstance(obj, HttpRequest):
+        subject_id = await subject.aget_identifier_for_request(obj)
+    else:
+        assert isinstance(subject, TypedSubject)  # TODO handle this gracefully
+        subject_id = await subject.aget_identifier_for_object(obj)
+    if subject_id is None:
+        return None
+    return SubjectIdentifier(subject.subject_class, subject_id)
+
+
 class IpAddressSubject(Subject):
     def get_identifier_for_request(self, request: HttpRequest) -> Optional[str]:
         try:
@@ -97,6 +207,9 @@ class IpAddressSubject(Subject):
         except KeyError:
             return None
 
+    async def aget_identifier_for_request(self, request: HttpRequest) -> Optional[str]:
+        return self.get_identifier_for_request(request)
+
     def __str__(self) -> str:
         return "IP address"
 
@@ -106,9 +219,20 @@ class UserSubject(TypedSubject["AbstractUser"]):
         user = request.user
         return self.get_identifier_for_object(user) if user.is_authenticated else None
 
+    async def aget_identifier_for_request(self, request: HttpRequest) -> Optional[str]:
+        auser = getattr(request, "auser", None)
+        if auser is None:
+            # `request.auser` is only available with Django's AuthenticationMiddleware
+            return await super().aget_identifier_for_request(request)
+        user = await auser()
+        return self.get_identifier_for_object(user) if user.is_authenticated else None
+
     def get_identifier_for_object(self, user: "AbstractUser") -> Optional[str]:
         return str(user.pk)
 
+    async def aget_identifier_for_object(self, user: "AbstractUser") -> Optional[str]:
+        return self.get_identifier_for_object(user)
+
     def is_supported_type(self, type: type) -> bool:
         from django.contrib.auth.models import AbstractUser
 
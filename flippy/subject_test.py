@@ -1,6 +1,13 @@
-from .subject import Subject, IpAddressSubject, UserSubject, SubjectIdentifier
+from .subject import (
+    Subject,
+    IpAddressSubject,
+    UserSubject,
+    SubjectIdentifier,
+    SubjectRegistry,
+)
 from .test_utils import request_factory, user_factory
 from .exceptions import ConfigurationError
+import hashlib
 from random import Random
 from pathlib import Path
 import pytest
@@ -27,6 +34,34 @@ def test_get_flag_score():
     assert expected_scores == actual_scores
 
 
+def reference_flag_score(subject_class: str, subject_id: str, flag_id: str) -> float:
+    """The original, straightforward implementation of get_flag_score."""
+    m = hashlib.sha256()
+    delimiter = b"\0\0\0\0Cookies!\3\2\1\0"
+    m.update(subject_class.encode())
+    m.update(delimiter)
+    m.update(subject_id.encode())
+    m.update(delimiter)
+    m.update(flag_id.encode())
+    digest = m.digest()
+    word = 0
+    for i in range(0, 32, 4):
+        word ^= int.from_bytes(digest[i : i + 4], "little")
+    return word / (1 << 32)
+
+
+def test_get_flag_score_matches_reference_implementation():
+    rng = Random(123)
+    for _ in range(1000):
+        subject_class = rng.choice(["someclass", "flippy.subject.UserSubject", ""])
+        subject_id = str(rng.randint(0, 10**12))
+        flag_id = rng.choice(["someflag", "enable_chat", "zażółć"])
+        identifier = SubjectIdentifier(subject_class, subject_id)
+        assert identifier.get_flag_score(flag_id) == reference_flag_score(
+            subject_class, subject_id, flag_id
+        )
+
+
 @pytest.mark.parametrize("ip", ["10.20.30.40", "40.30.20.10", None])
 def test_ip_address_subject(ip):
     assert IpAddressSubject().get_identifier_for_request(request_factory(ip=ip)) == ip
@@ -69,3 +104,25 @@ def test_get_installed_subjects_error(settings, names, match):
     setattr(settings, "FLIPPY_SUBJECTS", names)
     with pytest.raises(ConfigurationError, match=match):
         Subject.get_installed_subjects()
+
+
+def test_subject_registry_shares_instances():
+    registry = SubjectRegistry()
+    subject = registry.get("flippy.subject.UserSubject")
+    assert isinstance(subject, UserSubject)
+    assert registry.get("flippy.subject.UserSubject") is subject
+
+
+def test_subject_registry_reset():
+    registry = SubjectRegistry()
+    subject = registry.get("flippy.subject.UserSubject")
+    registry.reset()
+    assert registry.get("flippy.subject.UserSubject") is not subject
+
+
+def test_get_installed_subjects_follows_settings(settings):
+    settings.FLIPPY_SUBJECTS = ["flippy.subject.UserSubject"]
+    installed = Subject.get_installed_subjects()
+    assert installed is Subject.get_installed_subjects()
+    settings.FLIPPY_SUBJECTS = ["flippy.subject.IpAddressSubject"]
+    assert [type(x) for x in Subject.get_installed_subjects()] == [IpAddressSubject]
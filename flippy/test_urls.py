@@ -0,0 +1,8 @@
+from django.contrib import admin
+from django.urls import include, path
+
+urlpatterns = [
+    path("admin/", admin.site.urls),
+    path("flippy/", include("flippy.urls")),
+    path("internal/flippy/", include("flippy.metrics_urls")),
+]
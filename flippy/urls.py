@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+app_name = "flippy"
+
+urlpatterns = [
+    path("flags/", views.flags, name="flags"),
+]
@@ -0,0 +1,118 @@
+"""
+Variant keys, for caching flag-dependent pages.
+
+A variant key identifies which combination of flag states a response was rendered with:
+a digest of the rollout version and the flags taken into account, followed by a bitmap of their states,
+e.g. `3f2a9c1e.5` for the 1st and 3rd flag enabled.
+
+The flags taken into account are those listed in `FLIPPY_VARIANT_FLAGS` (all flags, if it isn't set).
+
+`flippy.middleware.FlippyVariantMiddleware` makes Django's cache middleware keep a separate copy
+of each page per variant, and `cache_page_per_variant` does the same for a single view.
+
+Only Django's cache sees the variant key of a request, as it's added to `request.META` on the server.
+Downstream caches (CDNs, proxies) can't tell the variants apart, so the responses are marked
+with `Cache-Control: s-maxage=0`, making shared caches check each reuse with the server.
+(`private` would keep Django's cache from storing them too.) Browsers may still cache them.
+"""
+
+import hashlib
+from functools import wraps
+from typing import Callable, Dict, Hashable, List, Optional
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.cache import cache_page
+
+from .flag import Flag, aevaluate_all, evaluate_all, flag_registry
+from .store import get_store
+
+# The response header carrying the variant key. Responses vary on the same (request) header,
+# which `set_variant_key` fills in on the server, so that Django's cache keeps each variant separately.
+VARIANT_HEADER = "X-Flippy-Variant"
+_META_KEY = "HTTP_X_FLIPPY_VARIANT"
+REQUEST_ATTRIBUTE = "_flippy_variant_key"
+
+
+def get_variant_flags() -> List[Flag]:
+    flag_ids = getattr(settings, "FLIPPY_VARIANT_FLAGS", None)
+    flags = flag_registry.sorted_by_id()
+    if flag_ids is None:
+        return list(flags)
+    return [flag for flag in flags if flag.id in flag_ids]
+
+
+def get_variant_key(request: HttpRequest) -> str:
+    """Return the variant key of the request. It's computed once per request."""
+    key = getattr(request, REQUEST_ATTRIBUTE, None)
+    if key is None:
+        flags = get_variant_flags()
+        states = evaluate_all(request, [flag.id for flag in flags])
+        key = _build_key(get_store().get_version(), flags, states)
+        setattr(request, REQUEST_ATTRIBUTE, key)
+    return key
+
+
+async def aget_variant_key(request: HttpRequest) -> str:
+    """Async version of `get_variant_key`."""
+    key = getattr(request, REQUEST_ATTRIBUTE, None)
+    if key is None:
+        flags = get_variant_flags()
+        states = await aevaluate_all(request, [flag.id for flag in flags])
+        key = _build_key(await get_store().aget_version(), flags, states)
+        setattr(request, REQUEST_ATTRIBUTE, key)
+    return key
+
+
+def _build_key(version: Hashable, flags: List[Flag], states: Dict[str, bool]) -> str:
+    digest = hashlib.sha1()
+    digest.update(repr(version).encode())
+    digest.update(repr([flag.id for flag in flags]).encode())
+    bitmap = 0
+    for index, flag in enumerate(flags):
+        if states[flag.id]:
+            bitmap |= 1 << index
+    return f"{digest.hexdigest()[:8]}.{bitmap:x}"
+
+
+def set_variant_key(request: HttpRequest, key: str) -> None:
+    # Overwrites whatever the client sent in the header.
+    request.META[_META_KEY] = key
+
+
+def add_variant_headers(response: HttpResponse, key: str) -> None:
+    response[VARIANT_HEADER] = key
+    patch_vary_headers(response, [VARIANT_HEADER])
+    # Clients don't send the header, so shared caches would serve one variant to everyone.
+    patch_cache_control(response, s_maxage=0)
+
+
+def cache_page_per_variant(
+    timeout: Optional[float], **kwargs
+) -> Callable[[Callable], Callable]:
+    """
+    Like Django's `cache_page`, but keeps a separate copy of the page for each variant key.
+
+        @cache_page_per_variant(60 * 15)
+        def home(request):
+            ...
+    """
+
+    def decorator(view_func: Callable) -> Callable:
+        @wraps(view_func)
+        def view_with_variant_headers(request, *args, **kwargs):
+            response = view_func(request, *args, **kwargs)
+            add_variant_headers(response, get_variant_key(request))
+            return response
+
+        cached_view = cache_page(timeout, **kwargs)(view_with_variant_headers)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            set_variant_key(request, get_variant_key(request))
+            return cached_view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,106 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.cache import FetchFromCacheMiddleware, UpdateCacheMiddleware
+from django.test import RequestFactory
+
+from .flag import Flag
+from .middleware import FlippyVariantMiddleware
+from .models import Rollout
+from .variants import VARIANT_HEADER, cache_page_per_variant, get_variant_key
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def flags():
+    Flag("a")
+    Flag("b", default=True)
+    Flag("c")
+    Rollout.objects.create(flag_id="c", subject="flippy.subject.IpAddressSubject")
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def get(has_ip=True):
+    request = RequestFactory().get("/")
+    if not has_ip:
+        del request.META["REMOTE_ADDR"]
+    return request
+
+
+class CountingView:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, request):
+        self.calls += 1
+        return HttpResponse(f"call {self.calls}")
+
+
+def test_variant_key_is_bitmap_of_states(flags):
+    key = get_variant_key(get())
+    version, bitmap = key.split(".")
+    assert len(version) == 8
+    assert bitmap == "6"  # b and c
+
+
+def test_variant_key_depends_on_states(flags):
+    enabled = get_variant_key(get())
+    disabled = get_variant_key(get(has_ip=False))
+    assert enabled.split(".")[1] == "6"
+    assert disabled.split(".")[1] == "2"
+
+
+def test_variant_key_depends_on_version(flags):
+    before = get_variant_key(get())
+    Rollout.objects.create(flag_id="a", subject="flippy.subject.IpAddressSubject")
+    assert get_variant_key(get()) != before
+
+
+def test_variant_flags_setting(flags, settings):
+    settings.FLIPPY_VARIANT_FLAGS = ["c"]
+    assert get_variant_key(get()).endswith(".1")
+
+
+def test_cache_page_per_variant(flags):
+    view = CountingView()
+    cached_view = cache_page_per_variant(60)(view)
+    response = cached_view(get())
+    assert response[VARIANT_HEADER].endswith(".6")
+    assert cached_view(get()).content == b"call 1"
+    # The same page, with another combination of flags
+    assert cached_view(get(has_ip=False)).content == b"call 2"
+    assert cached_view(get()).content == b"call 1"
+
+
+def test_client_cannot_choose_variant(flags):
+    cached_view = cache_page_per_variant(60)(CountingView())
+    cached_view(get())
+    spoofed = get(has_ip=False)
+    spoofed.META["HTTP_X_FLIPPY_VARIANT"] = get_variant_key(get())
+    assert cached_view(spoofed).content == b"call 2"
+
+
+def test_variant_middleware_with_cache_middleware(flags, settings):
+    settings.CACHE_MIDDLEWARE_SECONDS = 60
+    view = CountingView()
+    handler = UpdateCacheMiddleware(
+        FlippyVariantMiddleware(FetchFromCacheMiddleware(view))
+    )
+    first = handler(get())
+    assert VARIANT_HEADER in first["Vary"]
+    # Only Django's cache knows the variant, so shared caches must not reuse the page.
+    assert "s-maxage=0" in first["Cache-Control"]
+    assert handler(get()).content == b"call 1"
+    assert handler(get(has_ip=False)).content == b"call 2"
+
+
+def test_async_variant_middleware(flags):
+    async def view(request):
+        return HttpResponse()
+
+    response = async_to_sync(FlippyVariantMiddleware(view))(get())
+    assert response[VARIANT_HEADER].endswith(".6")
@@ -0,0 +1,89 @@
+"""
+An endpoint returning the flag states of the current request as JSON, for use by frontends,
+and one exposing the flag metrics to Prometheus.
+
+Include it with `path("flippy/", include("flippy.urls"))` and fetch `/flippy/flags/`:
+
+    {"chat":true,"dark_mode":false}
+
+Only the flags listed in `FLIPPY_EXPOSED_FLAGS` are returned (none, if it isn't set).
+Responses carry an ETag derived from the rollouts of the exposed flags and from how the subjects identify the request,
+so conditional requests get a 304 without evaluating the flags.
+
+`metrics` returns the metrics collected by `flippy.metrics` (404 unless `FLIPPY_METRICS` is enabled).
+It isn't part of `flippy.urls`, as it lists every flag; see `flippy.metrics_urls`.
+"""
+
+import hashlib
+from typing import List, Optional
+
+from django.conf import settings
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
+
+from .context import get_cache_for
+from .evaluation import Rule
+from .flag import Flag, get_plans, evaluate_all, flag_registry
+from .metrics import format_prometheus, get_recorder
+from .subject import build_identifier
+
+
+def get_exposed_flags() -> List[Flag]:
+    flag_ids = getattr(settings, "FLIPPY_EXPOSED_FLAGS", ())
+    return [flag for flag in flag_registry.sorted_by_name() if flag.id in flag_ids]
+
+
+def get_flags_etag(request: HttpRequest) -> Optional[str]:
+    """
+    Return a digest of everything the exposed flag states depend on.
+
+    That's the subjects and percentages of the flags' rollouts, the flag defaults, and the identifier
+    of the request by each of those subjects. Computing it is much cheaper than evaluating the flags,
+    as no scores are computed, and rollouts of other flags don't change it.
+    """
+    flags = get_exposed_flags()
+    plans = get_plans([flag.id for flag in flags])
+    cache = get_cache_for(request)
+    identifiers = {}
+    for plan in plans.values():
+        for rule in plan.rules:
+            if not isinstance(rule, Rule) or rule.subject_path in identifiers:
+                continue
+            if cache is not None:
+                identifier = cache.get_identifier(rule.subject, request)
+            else:
+                identifier = build_identifier(rule.subject, request)
+            identifiers[rule.subject_path] = identifier and identifier.subject_id
+    digest = hashlib.sha1()
+    digest.update(
+        repr([(flag.id, flag.default, plans[flag.id].shape) for flag in flags]).encode()
+    )
+    digest.update(repr(sorted(identifiers.items())).encode())
+    return digest.hexdigest()
+
+
+@require_GET
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=get_flags_etag)
+def flags(request: HttpRequest) -> JsonResponse:
+    flag_ids = [flag.id for flag in get_exposed_flags()]
+    return JsonResponse(
+        evaluate_all(request, flag_ids), json_dumps_params={"separators": (",", ":")}
+    )
+
+
+@require_GET
+def metrics(request: HttpRequest) -> HttpResponse:
+    recorder = get_recorder()
+    if recorder is None:
+        raise Http404("Flippy metrics are disabled")
+    # Other threads flush their checks periodically.
+    recorder.flush()
+    try:
+        totals = recorder.sink.read()
+    except NotImplementedError as e:
+        raise Http404(str(e)) from e
+    return HttpResponse(
+        format_prometheus(totals), content_type="text/plain; version=0.0.4"
+    )
@@ -0,0 +1,73 @@
+import pytest
+
+from .flag import Flag
+from .models import Rollout
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def flags(settings):
+    settings.FLIPPY_EXPOSED_FLAGS = ["chat", "dark_mode"]
+    Flag("chat")
+    Flag("dark_mode", default=True)
+    Rollout.objects.create(flag_id="chat", subject="flippy.subject.IpAddressSubject")
+
+
+def test_flags_endpoint_returns_compact_json(client, flags):
+    response = client.get("/flippy/flags/")
+    assert response.status_code == 200
+    assert response.content == b'{"chat":true,"dark_mode":true}'
+    assert response["ETag"]
+    assert "private" in response["Cache-Control"]
+
+
+def test_flags_endpoint_exposes_allowed_flags_only(client, flags, settings):
+    settings.FLIPPY_EXPOSED_FLAGS = ["chat"]
+    assert client.get("/flippy/flags/").json() == {"chat": True}
+    del settings.FLIPPY_EXPOSED_FLAGS
+    assert client.get("/flippy/flags/").json() == {}
+
+
+def test_conditional_request_is_not_evaluated(client, flags, monkeypatch):
+    etag = client.get("/flippy/flags/")["ETag"]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Flags should not be evaluated")
+
+    monkeypatch.setattr("flippy.views.evaluate_all", fail)
+    response = client.get("/flippy/flags/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+
+def test_etag_changes_with_rollouts(client, flags):
+    etag = client.get("/flippy/flags/")["ETag"]
+    Rollout.objects.create(
+        flag_id="chat", subject="flippy.subject.IpAddressSubject", enable_percentage=0
+    )
+    response = client.get("/flippy/flags/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.json() == {"chat": False, "dark_mode": True}
+
+
+def test_etag_changes_with_rollouts_updated_in_bulk(client, flags):
+    etag = client.get("/flippy/flags/")["ETag"]
+    Rollout.objects.filter(flag_id="chat").update(enable_percentage=0)
+    assert client.get("/flippy/flags/")["ETag"] != etag
+
+
+def test_etag_ignores_rollouts_of_other_flags(client, flags):
+    Flag("hidden")
+    etag = client.get("/flippy/flags/")["ETag"]
+    Rollout.objects.create(flag_id="hidden", subject="flippy.subject.IpAddressSubject")
+    assert client.get("/flippy/flags/")["ETag"] == etag
+
+
+def test_etag_depends_on_subject_identifiers(client, flags):
+    etag = client.get("/flippy/flags/", REMOTE_ADDR="10.0.0.1")["ETag"]
+    assert client.get("/flippy/flags/", REMOTE_ADDR="10.0.0.2")["ETag"] != etag
+    assert client.get("/flippy/flags/", REMOTE_ADDR="10.0.0.1")["ETag"] == etag
+
+
+def test_flags_endpoint_is_read_only(client, flags):
+    assert client.post("/flippy/flags/").status_code == 405
@@ -11,7 +11,12 @@ os.chdir(os.path.normpath(os.path.join(os.path.abspath(__file__), os.pardir)))
 setup(
     name="flippy",
     version="0.1",
-    packages=["flippy"],
+    packages=[
+        "flippy",
+        "flippy.management",
+        "flippy.management.commands",
+        "flippy.migrations",
+    ],
     include_package_data=True,
     license="ISC",
     description="A flexible feature flipper, simple to configure",
@@ -33,5 +38,8 @@ setup(
         "Topic :: Internet :: WWW/HTTP :: Dynamic Content",
     ],
     install_requires=["django", "dataclasses"],
-    extras_require={"test": ["pytest-django", "mockito", "mypy"]},
+    extras_require={
+        "test": ["pytest-django", "mockito", "mypy"],
+        "benchmark": ["pytest-benchmark"],
+    },
 )